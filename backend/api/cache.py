@@ -0,0 +1,209 @@
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+KEY_PREFIX = 'foodgram'
+VERSION_KEY = KEY_PREFIX + ':version:{}'
+LOG_LENGTH_KEY = KEY_PREFIX + ':log:{}'
+LOG_ENTRY_KEY = KEY_PREFIX + ':log:{}:{}'
+# Время хранения записей журнала: процесс, не обновлявшийся дольше,
+# перестраивает свои данные целиком.
+LOG_TIMEOUT = 60 * 60 * 24
+
+
+def get_version(namespace):
+    """
+    Текущая версия данных пространства имён.
+    Версия - время последнего изменения в наносекундах; она хранится
+    в кэше Django и одинакова для всех процессов, использующих общий кэш.
+    """
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    version = time.time_ns()
+    if cache.add(key, version, timeout=None):
+        return version
+    return cache.get(key, version)
+
+
+def bump_version(namespace):
+    """Делает устаревшими все данные пространства имён."""
+    cache.set(VERSION_KEY.format(namespace), time.time_ns(), timeout=None)
+
+
+def bump_version_on_commit(namespace):
+    """
+    Меняет версию пространства имён после фиксации текущей транзакции,
+    чтобы параллельный запрос не закэшировал под новой версией данные,
+    которые ещё не зафиксированы. Сколько бы объектов ни изменилось
+    в транзакции, версия меняется один раз.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_version(namespace)
+        return
+    for _, callback in connection.run_on_commit:
+        if getattr(callback, 'version_namespace', None) == namespace:
+            return
+
+    def bump():
+        bump_version(namespace)
+
+    bump.version_namespace = namespace
+    transaction.on_commit(bump)
+
+
+def get_log_length(namespace):
+    """Число записей в журнале изменений пространства имён."""
+    return cache.get(LOG_LENGTH_KEY.format(namespace), 0)
+
+
+def append_to_log(namespace, value):
+    """Добавляет запись в журнал изменений пространства имён."""
+    key = LOG_LENGTH_KEY.format(namespace)
+    cache.add(key, 0, timeout=None)
+    try:
+        number = cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснен из кэша: журнал начинается заново.
+        number = 1
+        cache.set(key, number, timeout=None)
+    cache.set(LOG_ENTRY_KEY.format(namespace, number), value, LOG_TIMEOUT)
+
+
+def read_log(namespace, start, end):
+    """
+    Записи журнала с номерами от start (не включая) до end или None,
+    если часть записей уже недоступна и данные нужно перестроить.
+    """
+    if end < start:
+        return None
+    keys = [
+        LOG_ENTRY_KEY.format(namespace, number)
+        for number in range(start + 1, end + 1)
+    ]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    return [entries[key] for key in keys]
+
+
+def append_to_log_on_commit(namespace, value):
+    """
+    После фиксации транзакции добавляет запись в журнал и меняет версию
+    пространства имён: увидевший новую версию процесс увидит и запись.
+    """
+
+    def append():
+        append_to_log(namespace, value)
+        bump_version(namespace)
+
+    transaction.on_commit(append)
+
+
+class CacheStats:
+    """Счётчики попаданий и промахов кэша по пространствам имён."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, namespace, hit):
+        with self._lock:
+            counters = self._counters.setdefault(
+                namespace, {'hits': 0, 'misses': 0}
+            )
+            counters['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        """Копия счётчиков текущего процесса."""
+        with self._lock:
+            return {
+                namespace: dict(counters)
+                for namespace, counters in self._counters.items()
+            }
+
+
+cache_stats = CacheStats()
+
+
+class NamespacedCache:
+    """
+    Обёртка над кэшем Django для одного пространства имён.
+    Ключи получают префикс пространства имён, а для версионируемых
+    пространств - и его текущую версию, поэтому bump_version делает
+    устаревшими сразу все ключи пространства.
+    """
+
+    def __init__(self, namespace, timeout=DEFAULT_TIMEOUT, versioned=True,
+                 alias=DEFAULT_CACHE_ALIAS):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.versioned = versioned
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        if self.versioned:
+            return (
+                f'{KEY_PREFIX}:{self.namespace}:'
+                f'{get_version(self.namespace)}:{key}'
+            )
+        return f'{KEY_PREFIX}:{self.namespace}:{key}'
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.make_key(key))
+        cache_stats.record(self.namespace, value is not None)
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        self.backend.set(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        self.backend.delete(self.make_key(key))
+
+    def get_or_set(self, key, builder, timeout=DEFAULT_TIMEOUT):
+        """Значение из кэша либо сохранённый результат builder()."""
+        value = self.get(key)
+        if value is None:
+            value = builder()
+            self.set(key, value, timeout)
+        return value
+
+    def invalidate(self):
+        """Делает устаревшими все ключи пространства имён."""
+        bump_version(self.namespace)
+
+
+class LocalVersionedCache:
+    """
+    Кэш в памяти процесса: хранит по одному значению на ключ и отдаёт его,
+    пока версия пространства имён не изменилась.
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    def get_or_build(self, namespace, key, builder):
+        """Значение из кэша либо результат builder() для текущей версии."""
+        version = get_version(namespace)
+        cached = self._data.get((namespace, key))
+        hit = cached is not None and cached[0] == version
+        cache_stats.record(namespace, hit)
+        if hit:
+            return cached[1]
+        value = builder()
+        self._data[(namespace, key)] = (version, value)
+        return value
+
+
+local_cache = LocalVersionedCache()
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """
+    Закрывает постоянные соединения с БД, которые перестали работать
+    (перезапуск БД, разрыв сети), до обработки запроса: запрос откроет
+    новое соединение вместо ошибки при первом обращении к БД.
+    Проверка - отдельный запрос к БД, поэтому каждое соединение
+    проверяется не чаще раза в DB_CONN_HEALTH_CHECK_INTERVAL секунд.
+    """
+
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        checked = getattr(connection, 'health_checked', None)
+        if checked is not None and checked[0] is connection.connection and (
+            now - checked[1] < settings.DB_CONN_HEALTH_CHECK_INTERVAL
+        ):
+            continue
+        if connection.is_usable():
+            connection.health_checked = (connection.connection, now)
+        else:
+            connection.close()
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from drf_extra_fields.fields import Base64FieldMixin
+from rest_framework.fields import FileField
+from recipes.storage import UPLOADS_DIRECTORY
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+class Base64RawImageField(Base64FieldMixin, FileField):
+    """
+    Картинка в формате base64 без декодирования изображения.
+    Тип файла определяется по сигнатуре, а проверка и обработка
+    изображения выполняются в фоне, после сохранения рецепта.
+    """
+
+    ALLOWED_TYPES = ('jpg', 'png', 'gif', 'webp')
+    INVALID_FILE_MESSAGE = 'Загрузите корректное изображение.'
+    INVALID_TYPE_MESSAGE = 'Неподдерживаемый формат изображения.'
+    TOO_LARGE_MESSAGE = 'Размер изображения превышает {} МБ.'
+
+    def get_file_name(self, decoded_file):
+        return f'{UPLOADS_DIRECTORY}/{super().get_file_name(decoded_file)}'
+
+    def get_file_extension(self, filename, decoded_file):
+        if len(decoded_file) > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise ValidationError(self.TOO_LARGE_MESSAGE.format(
+                settings.IMAGE_MAX_UPLOAD_SIZE // 2 ** 20
+            ))
+        for signature, extension in IMAGE_SIGNATURES:
+            if decoded_file.startswith(signature):
+                return extension
+        if decoded_file[:4] == b'RIFF' and decoded_file[8:12] == b'WEBP':
+            return 'webp'
+        raise ValidationError(self.INVALID_FILE_MESSAGE)
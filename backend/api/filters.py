@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Case, FloatField, Value, When
 from django_filters.rest_framework import FilterSet, filters
+from api.indexes import recipe_search_index
+from api.user_state import get_user_state
 from recipes.models import Recipe, Tag
+from recipes.search import full_text_search_available, search_recipes
 
 User = get_user_model()
 
@@ -17,24 +22,67 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart'
     )
 
+    search = filters.CharFilter(method='filter_search')
+
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='filter_ordering',
+    )
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_search(self, queryset, name, value):
+        """
+        Поиск по названию, ингредиентам и описанию рецепта
+        с сортировкой по релевантности.
+        """
+        if full_text_search_available():
+            return search_recipes(queryset, value)
+        recipe_search_index.ensure_built()
+        top = recipe_search_index.top(value, settings.SEARCH_RESULTS_LIMIT)
+        if not top:
+            return queryset.none()
+        # Рецепты с одинаковой релевантностью попадают в одно условие,
+        # поэтому число параметров запроса ограничено SEARCH_RESULTS_LIMIT.
+        groups = {}
+        for recipe_id, rank in top:
+            groups.setdefault(round(rank, 6), []).append(recipe_id)
+        return queryset.filter(
+            id__in=[recipe_id for recipe_id, _ in top]
+        ).annotate(
+            rank=Case(
+                *(When(id__in=recipe_ids, then=Value(rank))
+                  for rank, recipe_ids in groups.items()),
+                output_field=FloatField(),
+            )
+        ).order_by('-rank', '-pub_date')
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по предрассчитанному рейтингу рецептов."""
+        orderings = {
+            'popular': ('-score__popularity', '-pub_date'),
+            'trending': ('-score__trending', '-pub_date'),
+        }
+        return queryset.order_by(*orderings[value])
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated:
+            favorites = list(get_user_state(user).favorites)
             if value:
-                return queryset.filter(favorite=user.id)
+                return queryset.filter(id__in=favorites)
             else:
-                return queryset.exclude(favorite=user.id)
+                return queryset.exclude(id__in=favorites)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated:
+            carts = list(get_user_state(user).carts)
             if value:
-                return queryset.filter(cart=user.id)
+                return queryset.filter(id__in=carts)
             else:
-                return queryset.exclude(cart=user.id)
+                return queryset.exclude(id__in=carts)
         return queryset
@@ -0,0 +1,369 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Max
+from api.cache import get_log_length, get_version, read_log
+from recipes.models import Ingredient, IngredientsInRecipe, Recipe
+from recipes.search import iter_recipe_documents
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска без учёта регистра и буквы 'ё'."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def tokenize(value):
+    """Разбивает строку на нормализованные слова."""
+    return TOKEN_PATTERN.findall(normalize(value))
+
+
+class IngredientAutocompleteIndex:
+    """
+    Индекс для автодополнения названий ингредиентов в памяти процесса.
+    Ингредиенты хранятся отсортированными по нормализованному названию:
+    совпадения по началу строки находятся бинарным поиском, вхождения
+    подстроки - поиском по одной склеенной строке.
+    Индекс перестраивается при смене версии пространства имён
+    'ingredients'.
+    """
+
+    separator = '\n'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        # Элементы, ключи, смещения ключей и склеенная строка ключей.
+        # Публикуются одним кортежем, поэтому поиск, выполняемый
+        # одновременно с перестроением, видит индекс целиком.
+        self._data = ((), (), (), '')
+
+    def build(self, items):
+        """Строит индекс по объектам с атрибутом name."""
+        pairs = sorted(
+            ((normalize(item.name), item) for item in items),
+            key=lambda pair: pair[0]
+        )
+        keys = tuple(key for key, _ in pairs)
+        offsets = []
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + len(self.separator)
+        self._data = (
+            tuple(item for _, item in pairs),
+            keys,
+            tuple(offsets),
+            self.separator.join(keys),
+        )
+
+    def ensure_built(self):
+        """Перестраивает индекс, если ингредиенты изменились."""
+        version = get_version('ingredients')
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self.build(Ingredient.objects.all())
+                    self._version = version
+
+    def search(self, query, limit=None):
+        """
+        Ингредиенты, название которых начинается с query, затем
+        ингредиенты, содержащие query. Не более limit результатов.
+        """
+        query = normalize(query)
+        if not query or self.separator in query:
+            return []
+        items, keys, offsets, haystack = self._data
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + chr(0x10ffff), start)
+        result = list(items[start:end])
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+
+        position = haystack.find(query)
+        while position != -1:
+            index = bisect_right(offsets, position) - 1
+            if not start <= index < end:
+                result.append(items[index])
+                if limit is not None and len(result) >= limit:
+                    break
+            position = haystack.find(
+                query, offsets[index] + len(keys[index])
+            )
+        return result
+
+
+class IncrementalRecipeIndex:
+    """
+    Базовый индекс рецептов в памяти процесса, который обновляется
+    только для изменённых рецептов. Версия пространства имён
+    'recipe-index' меняется при сохранении и удалении рецептов; после
+    этого заново читаются рецепты, изменённые с момента прошлого чтения,
+    а id удалённых берутся из журнала пространства имён в кэше
+    (recipes.signals). Если журнал неполон или сменилась версия
+    'ingredients' (например, после переименования ингредиента), индекс
+    перестраивается целиком. Поиск и обновление выполняются под одной
+    блокировкой.
+    """
+
+    namespace = 'recipe-index'
+    # Запас на транзакции, зафиксированные позже сохранения рецепта.
+    slack = timedelta(minutes=5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = None
+        self._synced_at = None
+        self._log_length = 0
+        self.clear()
+
+    def clear(self):
+        """Очищает индекс."""
+        raise NotImplementedError
+
+    def add(self, recipe_id, document):
+        """Добавляет рецепт в индекс."""
+        raise NotImplementedError
+
+    def remove(self, recipe_id):
+        """Удаляет рецепт из индекса, если он там есть."""
+        raise NotImplementedError
+
+    def load(self, recipes):
+        """Пары (id рецепта, документ) для рецептов из queryset recipes."""
+        raise NotImplementedError
+
+    def build(self, documents):
+        """Строит индекс заново по парам (id рецепта, документ)."""
+        self.clear()
+        for recipe_id, document in documents:
+            self.add(recipe_id, document)
+
+    def update(self, recipe_ids, documents):
+        """Заменяет рецепты recipe_ids на переданные документы."""
+        for recipe_id in recipe_ids:
+            self.remove(recipe_id)
+        for recipe_id, document in documents:
+            self.add(recipe_id, document)
+
+    def ensure_built(self):
+        """Обновляет индекс, если рецепты или ингредиенты изменились."""
+        versions = (get_version(self.namespace), get_version('ingredients'))
+        if self._versions == versions:
+            return
+        with self._lock:
+            if self._versions == versions:
+                return
+            log_length = get_log_length(self.namespace)
+            synced_at = Recipe.objects.aggregate(
+                synced_at=Max('updated_at')
+            )['synced_at']
+            deleted = None
+            if (self._versions is not None and self._synced_at is not None
+                    and self._versions[1] == versions[1]):
+                deleted = read_log(
+                    self.namespace, self._log_length, log_length
+                )
+            if deleted is None:
+                self.build(self.load(Recipe.objects.all()))
+            else:
+                self.refresh(self._synced_at - self.slack, deleted)
+            self._synced_at = synced_at
+            self._log_length = log_length
+            self._versions = versions
+
+    def refresh(self, since, deleted_ids):
+        """Обновляет рецепты, изменённые после since, и удаляет удалённые."""
+        for recipe_id in deleted_ids:
+            self.remove(recipe_id)
+        changed = Recipe.objects.filter(updated_at__gte=since)
+        self.update(
+            changed.values_list('id', flat=True),
+            self.load(changed),
+        )
+
+
+class RecipeSearchIndex(IncrementalRecipeIndex):
+    """
+    Инвертированный индекс рецептов в памяти процесса - замена
+    полнотекстового поиска PostgreSQL для остальных БД.
+    Для каждого слова хранятся id рецептов и вес совпадения: слово
+    в названии весит больше, чем в ингредиентах, а в ингредиентах
+    больше, чем в описании. Слова запроса ищутся по началу слова.
+    """
+
+    weights = (1.0, 0.4, 0.2)
+
+    def clear(self):
+        self._tokens = []
+        self._postings = {}
+        self._recipe_tokens = {}
+
+    def load(self, recipes):
+        """Документы: название, названия ингредиентов и описание."""
+        for recipe_id, *fields in iter_recipe_documents(recipes.values('id')):
+            yield recipe_id, fields
+
+    def add(self, recipe_id, document):
+        self.remove(recipe_id)
+        scores = {}
+        for weight, field in zip(self.weights, document):
+            for token in tokenize(field):
+                scores[token] = scores.get(token, 0) + weight
+        for token, score in scores.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                insort(self._tokens, token)
+            self._postings[token][recipe_id] = score
+        self._recipe_tokens[recipe_id] = tuple(scores)
+
+    def remove(self, recipe_id):
+        for token in self._recipe_tokens.pop(recipe_id, ()):
+            postings = self._postings[token]
+            del postings[recipe_id]
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def get_postings(self, token):
+        """Совпадения для всех слов индекса, начинающихся с token."""
+        start = bisect_left(self._tokens, token)
+        end = bisect_left(self._tokens, token + chr(0x10ffff), start)
+        return [self._postings[key] for key in self._tokens[start:end]]
+
+    def search(self, query):
+        """
+        Словарь {id рецепта: релевантность} для рецептов,
+        содержащих все слова запроса.
+        """
+        with self._lock:
+            postings = sorted(
+                (self.get_postings(token) for token in set(tokenize(query))),
+                key=lambda lists: sum(len(scores) for scores in lists)
+            )
+            result = None
+            for lists in postings:
+                scores = {}
+                for token_scores in lists:
+                    for recipe_id, weight in token_scores.items():
+                        if result is None or recipe_id in result:
+                            scores[recipe_id] = (
+                                scores.get(recipe_id, 0) + weight
+                            )
+                if result is not None:
+                    for recipe_id in scores:
+                        scores[recipe_id] += result[recipe_id]
+                result = scores
+                if not result:
+                    break
+            return result or {}
+
+    def top(self, query, limit):
+        """
+        До limit пар (id рецепта, релевантность) с наибольшей
+        релевантностью, при равной - сначала более новые рецепты.
+        """
+        return heapq.nlargest(
+            limit,
+            self.search(query).items(),
+            key=lambda item: (item[1], item[0]),
+        )
+
+
+class RecipeIngredientIndex(IncrementalRecipeIndex):
+    """
+    Инвертированный индекс ингредиент -> рецепты в памяти процесса
+    для подбора рецептов по имеющимся ингредиентам.
+    """
+
+    def clear(self):
+        self._postings = {}
+        self._recipes = {}
+
+    def load(self, recipes):
+        """Документы: кортежи id ингредиентов рецепта."""
+        rows = IngredientsInRecipe.objects.filter(
+            recipe_id__in=recipes.values('id')
+        ).values_list('recipe_id', 'ingredients_id').order_by('recipe_id')
+        for recipe_id, group in groupby(rows.iterator(), itemgetter(0)):
+            yield recipe_id, tuple(row[1] for row in group)
+
+    def add(self, recipe_id, document):
+        self.remove(recipe_id)
+        for ingredient_id in document:
+            self._postings.setdefault(ingredient_id, set()).add(recipe_id)
+        self._recipes[recipe_id] = document
+
+    def remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            postings = self._postings[ingredient_id]
+            postings.discard(recipe_id)
+            if not postings:
+                del self._postings[ingredient_id]
+
+    def search(self, ingredient_ids, max_missing=None):
+        """
+        Рецепты, в которых есть хотя бы один из переданных ингредиентов,
+        в виде кортежей (id рецепта, есть ингредиентов, не хватает).
+        Сначала идут рецепты с наибольшей долей имеющихся ингредиентов,
+        при равной доле - с наименьшим числом недостающих.
+        """
+        matched = {}
+        with self._lock:
+            for ingredient_id in set(ingredient_ids):
+                for recipe_id in self._postings.get(ingredient_id, ()):
+                    matched[recipe_id] = matched.get(recipe_id, 0) + 1
+            sizes = {
+                recipe_id: len(self._recipes[recipe_id])
+                for recipe_id in matched
+            }
+        result = []
+        for recipe_id, count in matched.items():
+            missing = sizes[recipe_id] - count
+            if max_missing is None or missing <= max_missing:
+                result.append((recipe_id, count, missing))
+        return TopMatches(result, key=lambda row: (
+            -row[1] / (row[1] + row[2]), row[2], -row[0]
+        ))
+
+
+class TopMatches:
+    """
+    Найденные в индексе строки в порядке возрастания key без сортировки
+    всего списка: срез [start:stop] выбирает stop первых строк через
+    heapq. Пагинатору достаточно len() и срезов.
+    """
+
+    def __init__(self, rows, key):
+        self._rows = rows
+        self._key = key
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._rows))
+            return heapq.nsmallest(
+                stop, self._rows, key=self._key
+            )[start:stop:step]
+        if index < 0:
+            index += len(self._rows)
+        if not 0 <= index < len(self._rows):
+            raise IndexError(index)
+        return self[index:index + 1][0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+ingredient_index = IngredientAutocompleteIndex()
+recipe_search_index = RecipeSearchIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,214 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from api.indexes import tokenize
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку и число запросов к БД основных эндпоинтов API '
+        'на данных текущей БД (см. generate_data) и сравнивает результаты '
+        'с сохранёнными ранее'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Количество запросов в каждом сценарии')
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Количество незамеряемых запросов перед сценарием')
+        parser.add_argument(
+            '--scenarios', nargs='+', default=None,
+            help='Запустить только перечисленные сценарии')
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Очищать кэш перед каждым запросом')
+        parser.add_argument(
+            '--output', type=str, default=None,
+            help='Сохранить результаты в файл .json')
+        parser.add_argument(
+            '--compare', type=str, default=None,
+            help='Сравнить с результатами из файла .json')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел')
+
+    def get_scenarios(self, generator):
+        """
+        Сценарии: название, пользователь (None - анонимный) и функция,
+        возвращающая адрес очередного запроса.
+        """
+        users = list(User.objects.filter(
+            carts__isnull=False, subscribe__isnull=False
+        ).distinct().order_by('id').values_list('id', flat=True)[:100])
+        if not users:
+            raise CommandError(
+                'Нет пользователей с подписками и списками покупок, '
+                'создайте данные командой generate_data'
+            )
+        user = User.objects.get(id=generator.choice(users))
+        recipes = list(Recipe.objects.order_by().values_list('id', flat=True))
+        authors = list(User.objects.filter(
+            recipes_count__gt=0
+        ).order_by('id').values_list('id', flat=True))
+        tags = list(Tag.objects.order_by('id').values_list('slug', flat=True))
+        words = [
+            word
+            for name in Recipe.objects.order_by('id').values_list(
+                'name', flat=True
+            )[:1000]
+            for word in tokenize(name)
+        ]
+        ingredients = list(Ingredient.objects.order_by('id').values_list(
+            'name', flat=True
+        ))
+        pages = max(1, min(50, len(recipes) // 6))
+
+        def page():
+            return generator.randint(1, pages)
+
+        def ingredient_prefix():
+            return generator.choice(ingredients)[:generator.randint(1, 4)]
+
+        return (
+            ('recipes-list', None,
+             lambda: f'/api/recipes/?page={page()}&limit=6'),
+            ('recipes-list-auth', user,
+             lambda: f'/api/recipes/?page={page()}&limit=6'),
+            ('recipe-detail', None,
+             lambda: f'/api/recipes/{generator.choice(recipes)}/'),
+            ('recipe-detail-auth', user,
+             lambda: f'/api/recipes/{generator.choice(recipes)}/'),
+            ('recipes-filter-tags', None,
+             lambda: f'/api/recipes/?tags={generator.choice(tags)}&limit=6'),
+            ('recipes-filter-author', user,
+             lambda: f'/api/recipes/?author={generator.choice(authors)}'
+                     '&limit=6'),
+            ('recipes-favorited', user,
+             lambda: '/api/recipes/?is_favorited=1&limit=6'),
+            ('recipes-in-cart', user,
+             lambda: '/api/recipes/?is_in_shopping_cart=1&limit=6'),
+            ('recipes-search', None,
+             lambda: f'/api/recipes/?search={generator.choice(words)}'
+                     '&limit=6'),
+            ('feed', user, lambda: '/api/recipes/feed/?limit=6'),
+            ('subscriptions', user,
+             lambda: '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+            ('shopping-list', user, lambda: '/api/recipes/shopping_list/'),
+            ('shopping-cart-download', user,
+             lambda: '/api/recipes/download_shopping_cart/'),
+            ('ingredients-search', None,
+             lambda: f'/api/ingredients/?name={ingredient_prefix()}'),
+        )
+
+    def request(self, client, path, no_cache):
+        if no_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise CommandError(f'{path} вернул статус {response.status_code}')
+        return elapsed, len(queries)
+
+    def run(self, client, next_path, options):
+        for _ in range(options['warmup']):
+            self.request(client, next_path(), options['no_cache'])
+        timings = []
+        queries = []
+        for _ in range(options['requests']):
+            elapsed, count = self.request(
+                client, next_path(), options['no_cache']
+            )
+            timings.append(elapsed)
+            queries.append(count)
+        timings.sort()
+        return {
+            'p50': statistics.median(timings),
+            'p95': timings[max(0, int(len(timings) * 0.95) - 1)],
+            'mean': statistics.mean(timings),
+            'queries': statistics.median(queries),
+            'max_queries': max(queries),
+        }
+
+    def compare(self, name, result, baseline):
+        if name not in baseline:
+            return ''
+        previous = baseline[name]
+        return (
+            f' | p50 {(result["p50"] / previous["p50"] - 1) * 100:+.0f}%, '
+            f'p95 {(result["p95"] / previous["p95"] - 1) * 100:+.0f}%, '
+            f'запросов {result["max_queries"] - previous["max_queries"]:+d}'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один запрос в сценарии')
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as fp:
+                baseline = json.load(fp)['results']
+        generator = random.Random(options['seed'])
+        scenarios = self.get_scenarios(generator)
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {
+                name for name, _, _ in scenarios
+            }
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+        self.stdout.write(
+            f'БД: {connection.vendor}, рецептов: {Recipe.objects.count()}, '
+            f'пользователей: {User.objects.count()}, '
+            f'запросов в сценарии: {options["requests"]}'
+        )
+        results = {}
+        for name, user, next_path in scenarios:
+            if options['scenarios'] and name not in options['scenarios']:
+                continue
+            client = Client()
+            if user is not None:
+                token, _ = Token.objects.get_or_create(user=user)
+                client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+            result = results[name] = self.run(client, next_path, options)
+            self.stdout.write(
+                f'{name}: p50={result["p50"]:.2f} мс, '
+                f'p95={result["p95"]:.2f} мс, '
+                f'среднее={result["mean"]:.2f} мс, '
+                f'запросов к БД: {result["queries"]:g} '
+                f'(макс. {result["max_queries"]})'
+                + self.compare(name, result, baseline)
+            )
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(
+                    {
+                        'vendor': connection.vendor,
+                        'options': {
+                            key: options[key]
+                            for key in ('requests', 'warmup', 'no_cache',
+                                        'seed')
+                        },
+                        'results': results,
+                    },
+                    fp,
+                    ensure_ascii=False,
+                    indent=2,
+                )
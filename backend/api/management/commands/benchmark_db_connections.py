@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку запросов к API с новым соединением с БД '
+        'на каждый запрос и с постоянными соединениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', type=str, default='/api/users/?limit=6',
+            help='Адрес запроса к API')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Количество запросов в каждом режиме')
+        parser.add_argument(
+            '--max-age', type=int, default=60,
+            help='CONN_MAX_AGE для режима постоянных соединений')
+
+    def run(self, client, path, count, max_age):
+        """
+        Тестовый клиент не закрывает соединения после запроса,
+        поэтому это делается так же, как в обработчике WSGI.
+        """
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        opened = []
+
+        def count_connection(sender, **kwargs):
+            opened.append(sender)
+
+        connection_created.connect(count_connection)
+        timings = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                close_old_connections()
+                response = client.get(path)
+                close_old_connections()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{path} вернул статус {response.status_code}'
+                    )
+        finally:
+            connection_created.disconnect(count_connection)
+        timings.sort()
+        return {
+            'p50': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'mean': statistics.mean(timings),
+            'connections': len(opened),
+        }
+
+    def handle(self, *args, **options):
+        client = Client()
+        path = options['path']
+        original = connection.settings_dict['CONN_MAX_AGE']
+        self.stdout.write(
+            f'БД: {connection.vendor}, запрос: {path}, '
+            f'запросов: {options["requests"]}'
+        )
+        try:
+            client.get(path)
+            for title, max_age in (
+                ('без постоянных соединений', 0),
+                (f'CONN_MAX_AGE={options["max_age"]}', options['max_age']),
+            ):
+                stats = self.run(client, path, options['requests'], max_age)
+                self.stdout.write(
+                    f'{title}: p50={stats["p50"]:.2f} мс, '
+                    f'p95={stats["p95"]:.2f} мс, '
+                    f'среднее={stats["mean"]:.2f} мс, '
+                    f'открыто соединений: {stats["connections"]}'
+                )
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original
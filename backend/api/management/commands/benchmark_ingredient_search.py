@@ -0,0 +1,90 @@
+import json
+import os
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.indexes import IngredientAutocompleteIndex, normalize
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку автодополнения ингредиентов на каждое нажатие '
+        'клавиши по данным из файла .json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filename', type=str,
+            default=os.path.join(
+                settings.BASE_DIR, 'static', 'ingredients.json'
+            ),
+            help='Путь к файлу .json с ингредиентами')
+        parser.add_argument(
+            '--words', type=int, default=200,
+            help='Количество набираемых названий')
+        parser.add_argument(
+            '--limit', type=int, default=settings.INGREDIENTS_SEARCH_LIMIT,
+            help='Максимальное количество подсказок')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел')
+
+    def naive_search(self, items, query, limit):
+        """Поиск полным перебором, как icontains с сортировкой в базе."""
+        query = normalize(query)
+        found = [item for item in items if query in normalize(item.name)]
+        found.sort(key=lambda item: (
+            not normalize(item.name).startswith(query), normalize(item.name)
+        ))
+        return found[:limit]
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        return {
+            'p50': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'max': timings[-1],
+        }
+
+    def handle(self, *args, **options):
+        with open(options['filename']) as fp:
+            items = [
+                SimpleNamespace(id=number, **item)
+                for number, item in enumerate(json.load(fp), start=1)
+            ]
+        random.seed(options['seed'])
+        words = random.sample(items, min(options['words'], len(items)))
+        queries = [
+            word.name[:length]
+            for word in words
+            for length in range(1, len(word.name) + 1)
+        ]
+        limit = options['limit']
+
+        started = time.perf_counter()
+        index = IngredientAutocompleteIndex()
+        index.build(items)
+        build_time = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(
+            f'Ингредиентов: {len(items)}, нажатий клавиш: {len(queries)}, '
+            f'построение индекса: {build_time:.1f} мс'
+        )
+        for title, search in (
+            ('индекс', lambda query: index.search(query, limit)),
+            ('перебор', lambda query: self.naive_search(items, query, limit)),
+        ):
+            stats = self.measure(search, queries)
+            self.stdout.write(
+                f'{title}: p50={stats["p50"]:.1f} мкс, '
+                f'p95={stats["p95"]:.1f} мкс, max={stats["max"]:.1f} мкс'
+            )
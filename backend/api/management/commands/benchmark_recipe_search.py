@@ -0,0 +1,137 @@
+import json
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.indexes import RecipeSearchIndex, tokenize
+from recipes.fake_data import ADJECTIVES, DISHES, TEXT_WORDS
+from recipes.models import Recipe
+from recipes.search import full_text_search_available, search_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет поиск рецептов по синтетическому корпусу: индекс '
+        'в памяти процесса, полный перебор и полнотекстовый поиск PostgreSQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1_000_000,
+            help='Количество рецептов в синтетическом корпусе')
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Количество поисковых запросов')
+        parser.add_argument(
+            '--naive', action='store_true',
+            help='Сравнить с полным перебором (корпус хранится в памяти)')
+        parser.add_argument(
+            '--database', action='store_true',
+            help='Замерить поиск PostgreSQL по рецептам в текущей БД')
+        parser.add_argument(
+            '--limit', type=int, default=6,
+            help='Размер страницы результатов поиска в БД')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел')
+
+    def load_ingredient_names(self):
+        filename = os.path.join(
+            settings.BASE_DIR, 'static', 'ingredients.json'
+        )
+        with open(filename) as fp:
+            return [item['name'] for item in json.load(fp)]
+
+    def generate_corpus(self, count, ingredients, seed):
+        """Синтетические рецепты: (id, название, ингредиенты, описание)."""
+        generator = random.Random(seed)
+        text_words = list(TEXT_WORDS) + ingredients
+        weights = [1 / rank for rank in range(1, len(text_words) + 1)]
+        for recipe_id in range(1, count + 1):
+            name = (
+                f'{generator.choice(ADJECTIVES)} {generator.choice(DISHES)} '
+                f'{generator.choice(ingredients)}'
+            )
+            recipe_ingredients = ' '.join(generator.sample(ingredients, 8))
+            text = ' '.join(generator.choices(text_words, weights, k=15))
+            yield recipe_id, name, recipe_ingredients, text
+
+    def generate_queries(self, count, ingredients, seed):
+        generator = random.Random(seed + 1)
+        queries = []
+        for _ in range(count):
+            words = [
+                generator.choice(DISHES),
+                tokenize(generator.choice(ingredients))[0],
+            ]
+            queries.append(' '.join(words[:generator.randint(1, 2)]))
+        return queries
+
+    def naive_search(self, corpus, query):
+        """Полный перебор с теми же правилами совпадения, что и у индекса."""
+        tokens = set(tokenize(query))
+        result = []
+        for recipe_id, *fields in corpus:
+            words = [word for field in fields for word in tokenize(field)]
+            if all(
+                any(word.startswith(token) for word in words)
+                for token in tokens
+            ):
+                result.append(recipe_id)
+        return result
+
+    def measure(self, title, search, queries):
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter()
+            found += len(search(query))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{title}: p50={statistics.median(timings):.2f} мс, '
+            f'p95={timings[int(len(timings) * 0.95) - 1]:.2f} мс, '
+            f'max={timings[-1]:.2f} мс, '
+            f'найдено в среднем: {found / len(queries):.0f}'
+        )
+
+    def handle(self, *args, **options):
+        if options['database'] and not full_text_search_available():
+            raise CommandError('Полнотекстовый поиск доступен в PostgreSQL')
+        ingredients = self.load_ingredient_names()
+        queries = self.generate_queries(
+            options['queries'], ingredients, options['seed']
+        )
+        corpus = self.generate_corpus(
+            options['recipes'], ingredients, options['seed']
+        )
+        if options['naive']:
+            corpus = list(corpus)
+
+        started = time.perf_counter()
+        index = RecipeSearchIndex()
+        index.build(
+            (recipe_id, fields) for recipe_id, *fields in corpus
+        )
+        self.stdout.write(
+            f'Рецептов: {options["recipes"]}, запросов: {len(queries)}, '
+            f'построение индекса: {time.perf_counter() - started:.1f} с'
+        )
+        self.measure('индекс', index.search, queries)
+        if options['naive']:
+            self.measure(
+                'перебор',
+                lambda query: self.naive_search(corpus, query),
+                queries[:10],
+            )
+        if options['database']:
+            self.measure(
+                'PostgreSQL',
+                lambda query: list(search_recipes(
+                    Recipe.objects.all(), query
+                ).values_list('id', flat=True)[:options['limit']]),
+                queries,
+            )
@@ -0,0 +1,180 @@
+import http.client
+import socket
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+SLOW_PATHS = {
+    'upload': '/api/recipes/',
+    'download': '/api/ingredients/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: задержка быстрых запросов '
+        'без медленных клиентов и при медленных загрузках или скачиваниях'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', type=str, default='http://127.0.0.1:8000',
+            help='Адрес сервера, использующего ту же БД')
+        parser.add_argument(
+            '--path', type=str, default='/api/tags/',
+            help='Адрес быстрых запросов')
+        parser.add_argument(
+            '--slow-clients', type=int, default=50,
+            help='Количество медленных клиентов')
+        parser.add_argument(
+            '--slow-mode', choices=SLOW_PATHS, default='upload',
+            help='upload - тело запроса передаётся по байту, '
+                 'download - ответ читается небольшими частями')
+        parser.add_argument(
+            '--interval', type=float, default=0.5,
+            help='Пауза медленного клиента между частями (в секундах)')
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Количество параллельных быстрых клиентов')
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность каждого замера (в секундах)')
+        parser.add_argument(
+            '--timeout', type=float, default=5,
+            help='Тайм-аут быстрого запроса (в секундах)')
+
+    def connect(self, receive_buffer=None):
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if receive_buffer:
+            connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer
+            )
+        connection.connect((self.host, self.port))
+        return connection
+
+    def slow_upload(self, stop, token, interval):
+        """Запрос на создание рецепта, тело которого передаётся по байту."""
+        with self.connect() as connection:
+            connection.sendall((
+                f'POST {SLOW_PATHS["upload"]} HTTP/1.1\r\n'
+                f'Host: {self.host}\r\n'
+                f'Authorization: Token {token}\r\n'
+                'Content-Type: application/json\r\n'
+                'Content-Length: 1000000\r\n\r\n{'
+            ).encode())
+            while not stop.wait(interval):
+                connection.sendall(b' ')
+
+    def slow_download(self, stop, token, interval):
+        """Запрос полного списка ингредиентов, ответ читается по 256 байт."""
+        with self.connect(receive_buffer=1024) as connection:
+            connection.sendall((
+                f'GET {SLOW_PATHS["download"]} HTTP/1.1\r\n'
+                f'Host: {self.host}\r\n\r\n'
+            ).encode())
+            connection.settimeout(interval)
+            while not stop.wait(interval):
+                try:
+                    if not connection.recv(256):
+                        return
+                except socket.timeout:
+                    continue
+
+    def run_slow_client(self, slow_client, *args):
+        try:
+            slow_client(*args)
+        except OSError:
+            pass
+
+    def fast_client(self, path, deadline, timeout, timings, errors):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=timeout
+            )
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(response.status)
+                timings.append((time.perf_counter() - started) * 1000)
+            except (OSError, http.client.HTTPException):
+                errors.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+    def measure(self, title, options):
+        timings = []
+        errors = []
+        deadline = time.monotonic() + options['duration']
+        clients = [
+            threading.Thread(
+                target=self.fast_client,
+                args=(
+                    options['path'], deadline, options['timeout'],
+                    timings, errors,
+                ),
+            )
+            for _ in range(options['concurrency'])
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        timings.sort()
+        if timings:
+            latency = (
+                f'p50={statistics.median(timings):.1f} мс, '
+                f'p95={timings[max(0, int(len(timings) * 0.95) - 1)]:.1f} мс'
+            )
+        else:
+            latency = 'нет успешных запросов'
+        self.stdout.write(
+            f'{title}: запросов {len(timings)} '
+            f'({len(timings) / options["duration"]:.1f}/с), {latency}, '
+            f'ошибок и тайм-аутов: {len(errors)}'
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживаются только адреса http://')
+        self.host = url.hostname
+        self.port = url.port or 80
+        user = User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError('Нет пользователей для медленных загрузок')
+        token, _ = Token.objects.get_or_create(user=user)
+
+        self.measure('Без медленных клиентов', options)
+        stop = threading.Event()
+        slow_client = getattr(self, f'slow_{options["slow_mode"]}')
+        slow_clients = [
+            threading.Thread(
+                target=self.run_slow_client,
+                args=(slow_client, stop, token.key, options['interval']),
+                daemon=True,
+            )
+            for _ in range(options['slow_clients'])
+        ]
+        for client in slow_clients:
+            client.start()
+        try:
+            time.sleep(1)
+            self.measure(
+                f'Медленных клиентов ({options["slow_mode"]}): '
+                f'{options["slow_clients"]}',
+                options,
+            )
+        finally:
+            stop.set()
+            for client in slow_clients:
+                client.join(options['interval'] * 2)
@@ -0,0 +1,117 @@
+import threading
+
+from api.cache import cache_stats
+
+# Границы корзин гистограммы времени ответа (в секундах).
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class EndpointStats:
+    """
+    Накопленные показатели запросов к эндпоинтам: число запросов,
+    запросов к БД, время в БД, время сериализации, время рендеринга
+    ответа и общее время.
+    Показатели хранятся в памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, method, profile):
+        with self._lock:
+            stats = self._endpoints.get((endpoint, method))
+            if stats is None:
+                stats = self._endpoints[(endpoint, method)] = {
+                    'requests': 0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'db': 0.0,
+                    'serialize': 0.0,
+                    'render': 0.0,
+                    'total': 0.0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                }
+            stats['requests'] += 1
+            stats['queries'] += profile.queries
+            stats['max_queries'] = max(stats['max_queries'], profile.queries)
+            stats['db'] += profile.db_time
+            stats['serialize'] += profile.serialize_time
+            stats['render'] += profile.render_time
+            stats['total'] += profile.total_time
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if profile.total_time <= bound:
+                    stats['buckets'][index] += 1
+
+    def snapshot(self):
+        """Копия показателей текущего процесса."""
+        with self._lock:
+            return {
+                key: dict(stats, buckets=list(stats['buckets']))
+                for key, stats in self._endpoints.items()
+            }
+
+
+endpoint_stats = EndpointStats()
+
+
+def format_labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    )
+
+
+def render_prometheus():
+    """Показатели эндпоинтов и кэша в текстовом формате Prometheus."""
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{{{labels}}} {value}')
+
+    endpoints = sorted(endpoint_stats.snapshot().items())
+    duration = []
+    for (endpoint, method), stats in endpoints:
+        labels = format_labels(endpoint=endpoint, method=method)
+        for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+            duration.append(('_bucket', f'{labels},le="{bound}"', count))
+        duration.append(('_bucket', f'{labels},le="+Inf"', stats['requests']))
+        duration.append(('_sum', labels, stats['total']))
+        duration.append(('_count', labels, stats['requests']))
+    metric(
+        'foodgram_http_request_duration_seconds', 'histogram',
+        'Время обработки запроса.', duration,
+    )
+    for name, key, metric_type, help_text in (
+        ('foodgram_http_db_queries_total', 'queries', 'counter',
+         'Число запросов к БД.'),
+        ('foodgram_http_db_queries_max', 'max_queries', 'gauge',
+         'Максимальное число запросов к БД за один запрос.'),
+        ('foodgram_http_db_seconds_total', 'db', 'counter',
+         'Время выполнения запросов к БД.'),
+        ('foodgram_http_serialize_seconds_total', 'serialize', 'counter',
+         'Время сериализации ответа без запросов к БД.'),
+        ('foodgram_http_render_seconds_total', 'render', 'counter',
+         'Время рендеринга ответа.'),
+    ):
+        metric(name, metric_type, help_text, [
+            ('', format_labels(endpoint=endpoint, method=method), stats[key])
+            for (endpoint, method), stats in endpoints
+        ])
+    metric(
+        'foodgram_cache_requests_total', 'counter',
+        'Обращения к кэшу по пространствам имён.',
+        [
+            ('', format_labels(namespace=namespace, result=result), count)
+            for namespace, counters in sorted(cache_stats.snapshot().items())
+            for result, count in (
+                ('hit', counters['hits']), ('miss', counters['misses'])
+            )
+        ],
+    )
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,165 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from api.metrics import endpoint_stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Эндпоинт выполнил больше запросов к БД, чем объявлено во вьюсете."""
+
+
+class RequestProfile:
+    """
+    Число и время запросов к БД, время сериализации (без запросов к БД),
+    время рендеринга и общее время.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @contextmanager
+    def measure_serialization(self):
+        """
+        Учитывает время сериализации. Вложенные сериализаторы
+        не учитываются повторно, запросы к БД внутри вычитаются.
+        """
+        if self.serializing:
+            yield
+            return
+        self.serializing = True
+        started = time.perf_counter()
+        db_time = self.db_time
+        try:
+            yield
+        finally:
+            self.serialize_time += (
+                time.perf_counter() - started - (self.db_time - db_time)
+            )
+            self.serializing = False
+
+    def server_timing(self):
+        app_time = (
+            self.total_time - self.db_time - self.serialize_time
+            - self.render_time
+        )
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}{description}'
+            for name, duration, description in (
+                ('db', self.db_time, f';desc="{self.queries} queries"'),
+                ('serialize', self.serialize_time, ''),
+                ('render', self.render_time, ''),
+                ('app', max(app_time, 0), ''),
+                ('total', self.total_time, ''),
+            )
+        )
+
+
+def get_query_budget(request):
+    """
+    Бюджет запросов к БД для действия вьюсета из его атрибута
+    query_budgets: {'list': 5, 'retrieve': 4, ...}.
+    """
+    match = request.resolver_match
+    view_class = getattr(match and match.func, 'cls', None)
+    budgets = getattr(view_class, 'query_budgets', None)
+    if not budgets:
+        return None
+    actions = getattr(match.func, 'actions', None) or {}
+    return budgets.get(actions.get(request.method.lower()))
+
+
+class ProfilingMiddleware:
+    """
+    Считает запросы к БД и время обработки каждого запроса, добавляет
+    их в накопленные показатели эндпоинта и проверяет бюджет запросов
+    к БД, объявленный во вьюсете. Для потоковых ответов учитывается и
+    чтение тела: показатели записываются, когда тело прочитано целиком.
+    Заголовок Server-Timing добавляется только в режиме DEBUG и для
+    администраторов и только к непотоковым ответам: заголовки потокового
+    ответа отправляются раньше, чем известно время его отдачи.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        request.profile = profile
+        started = time.perf_counter()
+        with self.count_queries(profile):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.profile_streaming_content(
+                request, response.streaming_content, profile, started
+            )
+            return response
+        profile.total_time = time.perf_counter() - started
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = profile.server_timing()
+        self.record(request, profile)
+        return response
+
+    @contextmanager
+    def count_queries(self, profile):
+        """Учитывает в profile запросы ко всем БД в текущем потоке."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            yield
+
+    def profile_streaming_content(self, request, content, profile, started):
+        """Тело потокового ответа, чтение которого тоже профилируется."""
+        with self.count_queries(profile):
+            yield from content
+        profile.total_time = time.perf_counter() - started
+        self.record(request, profile)
+
+    def record(self, request, profile):
+        match = request.resolver_match
+        endpoint = match.view_name if match else 'unmatched'
+        endpoint_stats.record(endpoint, request.method, profile)
+        self.check_query_budget(request, endpoint, profile)
+
+    def process_template_response(self, request, response):
+        """Время рендеринга ответа DRF в JSON и другие форматы."""
+        started = time.perf_counter()
+
+        def measure(response):
+            request.profile.render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(measure)
+        return response
+
+    def check_query_budget(self, request, endpoint, profile):
+        budget = get_query_budget(request)
+        if budget is None or profile.queries <= budget:
+            return
+        message = (
+            f'{request.method} {request.get_full_path()} ({endpoint}): '
+            f'{profile.queries} запросов к БД при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,150 @@
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from api.cache import NamespacedCache, get_version, local_cache
+from api.user_state import get_user_state
+
+response_cache = NamespacedCache(
+    'responses', timeout=settings.ANONYMOUS_CACHE_TIMEOUT, versioned=False
+)
+
+
+class CachedListMixin:
+    """
+    Отдаёт список справочника из кэша в памяти процесса.
+    JSON хранится уже сериализованным, ответ снабжается заголовками ETag
+    и Last-Modified, повторный запрос браузера получает 304.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(self.cache_namespace)
+        etag = f'"{self.cache_namespace}-{version}"'
+        last_modified = version // 10 ** 9
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                local_cache.get_or_build(
+                    self.cache_namespace, 'list', self.render_list
+                ),
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def render_list(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(queryset, many=True)
+        return JSONRenderer().render(serializer.data)
+
+
+class ConditionalRecipeMixin:
+    """
+    HTTP-кэширование рецептов.
+    Ответы анонимным пользователям на запросы списка хранятся в общем
+    кэше по полному адресу запроса и версиям данных, страница рецепта
+    снабжается ETag. Last-Modified (по последнему изменению рецепта
+    и справочников) отдаётся только анонимным пользователям: ответ
+    пользователю зависит и от его избранного, корзины и подписок.
+    Повторный запрос с If-None-Match / If-Modified-Since получает 304.
+    """
+
+    response_cache_namespaces = ('recipes', 'tags', 'ingredients', 'users')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        versions = [
+            get_version(namespace)
+            for namespace in self.response_cache_namespaces
+        ]
+        digest = hashlib.md5(
+            f'{request.get_full_path()}:{versions}'.encode()
+        ).hexdigest()
+        etag = f'"{digest}"'
+        last_modified = max(versions) // 10 ** 9
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            key = f'{self.basename}:{digest}'
+            content = response_cache.get(key)
+            if content is None:
+                content = JSONRenderer().render(
+                    super().list(request, *args, **kwargs).data
+                )
+                response_cache.set(key, content)
+            response = HttpResponse(
+                content, content_type='application/json'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.ANONYMOUS_CACHE_TIMEOUT
+        )
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs.get(self.lookup_field))
+        row = pk.isdecimal() and self.get_queryset().model.objects.filter(
+            pk=pk
+        ).values_list('updated_at', 'author_id').first()
+        if not row:
+            return super().retrieve(request, *args, **kwargs)
+        pk = int(pk)
+        updated_at, author_id = row
+        versions = [
+            get_version(namespace)
+            for namespace in self.response_cache_namespaces[1:]
+        ]
+        key = [pk, updated_at.isoformat(), *versions]
+        if request.user.is_anonymous:
+            last_modified = max(
+                int(updated_at.timestamp()),
+                *(version // 10 ** 9 for version in versions),
+            )
+        else:
+            # Время изменения избранного, корзины и подписок неизвестно:
+            # ответ пользователю проверяется только по ETag.
+            last_modified = None
+            state = get_user_state(request.user)
+            key += [
+                request.user.id,
+                pk in state.favorites,
+                pk in state.carts,
+                author_id in state.subscriptions,
+            ]
+        etag = f'"{hashlib.md5(str(key).encode()).hexdigest()}"'
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is None:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.ANONYMOUS_CACHE_TIMEOUT,
+            )
+        return response
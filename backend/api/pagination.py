@@ -1,7 +1,72 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from recipes.feed import Feed
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Курсорный пагинатор для бесконечной прокрутки: страница выбирается
+    по ключу сортировки, без OFFSET и подсчёта общего количества.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Курсор хранит только поля cursor_ordering, поэтому другая
+        сортировка (по релевантности поиска, рейтингу) потерялась бы.
+        """
+        ordering = self.get_ordering(request, queryset, view)
+        if isinstance(queryset, QuerySet) and queryset.query.order_by and (
+            tuple(queryset.query.order_by) != tuple(ordering)
+        ):
+            raise ValidationError({
+                'errors': 'Курсорная пагинация недоступна при поиске '
+                          'и сортировке по рейтингу!'
+            })
+        return super().paginate_queryset(queryset, request, view)
 
 
 class CustomPagination(PageNumberPagination):
-    """Кастомный пагинатор."""
+    """
+    Кастомный пагинатор.
+    С параметром pagination=cursor, либо при переданном курсоре,
+    используется курсорная пагинация, если список не отсортирован иначе
+    (поиск, ordering). Списки, посчитанные не в БД, всегда разбиваются
+    на страницы по номеру.
+    Без параметра limit на странице 6 объектов, больше 100 не выдаётся.
+    """
 
+    page_size = 6
     page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get('pagination') == 'cursor'
+            or CustomCursorPagination.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request) and isinstance(
+            queryset, (QuerySet, Feed)
+        ):
+            self.cursor_paginator = CustomCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,15 +1,36 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
-from django.db.models import F
+from django.db import transaction
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
+from api.fields import Base64RawImageField
+from api.user_state import get_user_state
+from recipes.image_processing import release_image_on_commit
 from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from recipes.shopping_list import change_shopping_lists
+from recipes.thumbnails import get_thumbnail_url
 
 User = get_user_model()
 
 
-class CustomUserSerializer(UserSerializer):
+class ProfiledSerializerMixin:
+    """
+    Учитывает время сериализации в профиле запроса (api.middleware),
+    если профилирование включено.
+    """
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        profile = getattr(request, 'profile', None)
+        if profile is None:
+            return super().to_representation(instance)
+        with profile.measure_serialization():
+            return super().to_representation(instance)
+
+
+class CustomUserSerializer(ProfiledSerializerMixin, UserSerializer):
     """Сериализатор модели пользователей."""
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
@@ -31,24 +52,58 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return user.subscribe.filter(id=obj.id).exists()
+        return obj.id in get_user_state(user).subscriptions
+
+
+class ThumbnailField(serializers.ReadOnlyField):
+    """
+    Адрес миниатюры картинки рецепта заданного размера и формата.
+    Пока картинка обрабатывается, миниатюры нет.
+    """
+
+    def __init__(self, size, thumbnail_format='JPEG', **kwargs):
+        self.size = size
+        self.thumbnail_format = thumbnail_format
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if recipe.image_status != Recipe.IMAGE_READY:
+            return None
+        url = get_thumbnail_url(
+            recipe.image, self.size, self.thumbnail_format
+        )
+        request = self.context.get('request')
+        if url is None or request is None:
+            return url
+        return request.build_absolute_uri(url)
 
 
-class RecipesShortSerializer(serializers.ModelSerializer):
+class RecipesShortSerializer(ProfiledSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор модели рецептов с ограничееным набором полей."""
 
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    thumbnail = ThumbnailField('subscription')
+    thumbnail_webp = ThumbnailField('subscription', 'WEBP')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id',
+            'name',
+            'image',
+            'thumbnail',
+            'thumbnail_webp',
+            'cooking_time',
+        )
         read_only_fields = ('__all__', )
 
 
 class SubscribeSerializer(CustomUserSerializer):
     """Сериализатор подписок пользователей."""
 
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
     recipes = serializers.SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
@@ -60,20 +115,19 @@ class SubscribeSerializer(CustomUserSerializer):
 
     def get_recipes(self, obj):
         """Получение рецептов пользователя."""
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipesShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        """Подсчёт рецептов пользователя."""
-        return obj.recipes.count()
-
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(ProfiledSerializerMixin,
+                            serializers.ModelSerializer):
     """Сериализатор модели ингридиентов."""
 
     class Meta:
@@ -81,7 +135,44 @@ class IngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit',)
 
 
-class TagsSerializer(serializers.ModelSerializer):
+class IngredientsInRecipeSerializer(serializers.ModelSerializer):
+    """Сериализатор количества ингридиента в рецепте."""
+
+    id = serializers.ReadOnlyField(source='ingredients.id')
+    name = serializers.ReadOnlyField(source='ingredients.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredients.measurement_unit'
+    )
+    amount = serializers.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        coerce_to_string=False,
+        read_only=True,
+    )
+
+    class Meta:
+        model = IngredientsInRecipe
+        fields = ('id', 'name', 'measurement_unit', 'amount',)
+
+
+class ShoppingListItemSerializer(ProfiledSerializerMixin,
+                                 serializers.Serializer):
+    """
+    Сериализатор строки списка покупок из get_shopping_list: продукт
+    и количество в канонической единице измерения.
+    """
+
+    name = serializers.ReadOnlyField(source='ingredient')
+    measurement_unit = serializers.ReadOnlyField(source='measure')
+    amount = serializers.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        coerce_to_string=False,
+        read_only=True,
+    )
+
+
+class TagsSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """Сериализатор Тегов."""
 
     class Meta:
@@ -90,15 +181,21 @@ class TagsSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'color', 'slug',)
 
 
-class RecipesSerializer(serializers.ModelSerializer):
+class RecipesSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """Сериализатор модели рецептов."""
 
     tags = TagsSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = IngredientsInRecipeSerializer(
+        source='ingredientsinrecipe_set',
+        many=True,
+        read_only=True,
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = Base64RawImageField()
+    thumbnail = ThumbnailField('card')
+    thumbnail_webp = ThumbnailField('card', 'WEBP')
 
     class Meta:
         model = Recipe
@@ -111,6 +208,9 @@ class RecipesSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_status',
+            'thumbnail',
+            'thumbnail_webp',
             'text',
             'cooking_time',
         )
@@ -119,6 +219,7 @@ class RecipesSerializer(serializers.ModelSerializer):
             'id',
             'is_favorited',
             'is_in_shopping_cart',
+            'image_status',
         )
 
     def validate(self, data):
@@ -131,29 +232,30 @@ class RecipesSerializer(serializers.ModelSerializer):
         if tags:
             self.check_data_as_list(tags)
             for tag in tags:
-                self.check_value_for_validate(tag, Tag)
-            data['tags'] = tags
+                self.check_value_for_validate(tag)
+            data['tags'] = self.check_objects_exist(tags, Tag)
 
         if ingredients:
             self.check_data_as_list(ingredients)
-            valid_ingredients = []
+            valid_ingredients = {}
             for ing in ingredients:
                 ing_id = ing.get('id')
-                ingredient = self.check_value_for_validate(ing_id, Ingredient)
-                ingredient = ing.get('id')
-
+                self.check_value_for_validate(ing_id)
                 amount = ing.get('amount')
                 self.check_value_for_validate(amount)
-
-                valid_ingredients.append(
-                    {'ingredient': ingredient, 'amount': amount}
-                )
-            data['ingredients'] = valid_ingredients
+                if int(ing_id) in valid_ingredients:
+                    raise ValidationError(
+                        f'Ингредиент {ing_id} указан несколько раз!'
+                    )
+                valid_ingredients[int(ing_id)] = amount
+            self.check_objects_exist(valid_ingredients, Ingredient)
+            data['ingredients'] = [
+                {'ingredient': ingredient, 'amount': amount}
+                for ingredient, amount in valid_ingredients.items()
+            ]
 
         if name:
             data['name'] = str(name).strip().capitalize()
-        else:
-            name = str(Recipe.objects.filter(id=self.context.get('id')))
 
         data['author'] = self.context.get('request').user
         return data
@@ -165,29 +267,30 @@ class RecipesSerializer(serializers.ModelSerializer):
                 f'{value} должен быть в формате списка!'
             )
 
-    def check_value_for_validate(self, value, klass=None) -> None:
+    def check_value_for_validate(self, value) -> None:
         """Проверяет корректность переданного значения."""
 
         if not str(value).isdecimal():
             raise ValidationError(
                 f'Вместо {value} должно быть цифровое значение!'
             )
-        if klass:
-            obj = klass.objects.filter(id=value)
-            if not obj:
+
+    def check_objects_exist(self, values, klass):
+        """
+        Проверяет одним запросом, что объекты с переданными id существуют.
+        Возвращает список id.
+        """
+
+        ids = [int(value) for value in values]
+        found = set(
+            klass.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        for value in ids:
+            if value not in found:
                 raise ValidationError(
                     f'{klass._meta.verbose_name} {value} не существует!'
                 )
-            return obj[0]
-
-    def get_ingredients(self, obj):
-        """Получить список ингридиентов рецепта."""
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientsinrecipe__amount')
-        )
+        return ids
 
     def get_is_favorited(self, obj):
         """Проверка - добавлен ли рецеп в избранное."""
@@ -195,7 +298,7 @@ class RecipesSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return user.favorites.filter(id=obj.id).exists()
+        return obj.id in get_user_state(user).favorites
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка - добавлен ли рецеп в список покупок."""
@@ -203,8 +306,9 @@ class RecipesSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return user.carts.filter(id=obj.id).exists()
+        return obj.id in get_user_state(user).carts
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта."""
 
@@ -225,22 +329,70 @@ class RecipesSerializer(serializers.ModelSerializer):
 
         IngredientsInRecipe.objects.bulk_create(
             [IngredientsInRecipe(
-                ingredients=Ingredient.objects.get(
-                    id=ingredient['ingredient']
-                ),
+                ingredients_id=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def update_ingredients_amounts(self, ingredients, recipe):
+        """
+        Изменение количества ингридиентов рецепта: удаляются, добавляются
+        и изменяются только отличающиеся записи сквозной таблицы.
+        Разница прибавляется к спискам покупок с этим рецептом.
+        """
+
+        current = {
+            amount.ingredients_id: amount
+            for amount in recipe.ingredientsinrecipe_set.all()
+        }
+        new = {
+            ingredient['ingredient']: Decimal(str(ingredient['amount']))
+            for ingredient in ingredients
+        }
+        deltas = {
+            ingredient: -row.amount for ingredient, row in current.items()
+        }
+        for ingredient, amount in new.items():
+            deltas[ingredient] = deltas.get(ingredient, 0) + amount
+        change_shopping_lists(recipe.id, deltas)
+
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientsInRecipe.objects.filter(
+                recipe=recipe,
+                ingredients_id__in=removed
+            ).delete()
+
+        self.create_ingredients_amounts(
+            recipe=recipe,
+            ingredients=[
+                {'ingredient': ingredient, 'amount': amount}
+                for ingredient, amount in new.items()
+                if ingredient not in current
+            ]
+        )
+
+        changed = []
+        for ingredient, amount in new.items():
+            row = current.get(ingredient)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientsInRecipe.objects.bulk_update(changed, ('amount',))
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
         """Изменение рецепта."""
 
         tags = validated_data.get('tags')
         ingredients = validated_data.get('ingredients')
+        old_image = recipe.image.name
 
         recipe.image = validated_data.get(
             'image', recipe.image)
+        recipe.image_status = validated_data.get(
+            'image_status', recipe.image_status)
         recipe.name = validated_data.get(
             'name', recipe.name)
         recipe.text = validated_data.get(
@@ -252,10 +404,27 @@ class RecipesSerializer(serializers.ModelSerializer):
             recipe.tags.set(tags)
 
         if ingredients:
-            recipe.ingredients.clear()
-            self.create_ingredients_amounts(
+            self.update_ingredients_amounts(
                 recipe=recipe,
                 ingredients=ingredients
             )
         recipe.save()
+        if recipe.image.name != old_image:
+            release_image_on_commit(old_image)
         return recipe
+
+
+class CookRecipeSerializer(RecipesSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам:
+    сколько ингредиентов рецепта есть и сколько не хватает.
+    """
+
+    ingredients_matched = serializers.ReadOnlyField()
+    ingredients_missing = serializers.ReadOnlyField()
+
+    class Meta(RecipesSerializer.Meta):
+        fields = RecipesSerializer.Meta.fields + (
+            'ingredients_matched',
+            'ingredients_missing',
+        )
@@ -0,0 +1,137 @@
+import csv
+import io
+import os
+from datetime import datetime as dt
+from itertools import chain
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# Шрифт с кириллицей: стандартные шрифты PDF её не содержат.
+PDF_FONT = 'DejaVuSans'
+PDF_FONT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fonts', 'DejaVuSans.ttf'
+)
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """Псевдобуфер: возвращает записанную строку вместо её хранения."""
+
+    def write(self, value):
+        return value
+
+
+class BaseShoppingListRenderer:
+    """
+    Базовый формирователь файла со списком покупок.
+    Файл отдаётся по частям, по мере чтения строк из базы данных.
+    """
+
+    extension = None
+    content_type = None
+
+    def __init__(self, user):
+        self.user = user
+
+    def get_filename(self):
+        return f'{self.user.username}_shopping_list.{self.extension}'
+
+    def render(self, ingredients):
+        """Генератор частей файла для переданных ингредиентов."""
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(BaseShoppingListRenderer):
+    """Список покупок в текстовом формате."""
+
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def render(self, ingredients):
+        yield (
+            f'Список покупок для: {self.user.get_full_name()}\n'
+            f'Дата: {dt.today():%d-%m-%Y}\n\n'
+        )
+        for ing in ingredients:
+            yield f'{ing["ingredient"]}: {ing["amount"]} {ing["measure"]}\n'
+        yield '\nПриятного аппетита!'
+
+
+class CSVShoppingListRenderer(BaseShoppingListRenderer):
+    """Список покупок в формате CSV."""
+
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def render(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for ing in ingredients:
+            yield writer.writerow(
+                (ing['ingredient'], ing['amount'], ing['measure'])
+            )
+
+
+class PDFShoppingListRenderer(BaseShoppingListRenderer):
+    """
+    Список покупок в формате PDF. Строки читаются из базы данных
+    по частям и сразу рисуются на страницах; таблица ссылок PDF
+    пишется в конце документа, поэтому готовый файл отдаётся
+    частями после отрисовки последней страницы.
+    """
+
+    extension = 'pdf'
+    content_type = 'application/pdf'
+    font_size = 12
+    line_height = 7 * mm
+    margin = 20 * mm
+
+    def get_canvas(self, buffer):
+        if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(PDF_FONT, PDF_FONT_PATH))
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setTitle('Список покупок')
+        return pdf
+
+    def render(self, ingredients):
+        buffer = io.BytesIO()
+        pdf = self.get_canvas(buffer)
+        _, height = A4
+        lines = (
+            f'{ing["ingredient"]}: {ing["amount"]} {ing["measure"]}'
+            for ing in ingredients
+        )
+        header = (
+            f'Список покупок для: {self.user.get_full_name()}',
+            f'Дата: {dt.today():%d-%m-%Y}',
+            '',
+        )
+        y = 0
+        footer = ('', 'Приятного аппетита!')
+        for line in chain(header, lines, footer):
+            if y < self.margin:
+                if y:
+                    pdf.showPage()
+                pdf.setFont(PDF_FONT, self.font_size)
+                y = height - self.margin
+            pdf.drawString(self.margin, y, line)
+            y -= self.line_height
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_RENDERERS = {
+    renderer.extension: renderer
+    for renderer in (
+        TextShoppingListRenderer,
+        CSVShoppingListRenderer,
+        PDFShoppingListRenderer,
+    )
+}
@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.cache import bump_version_on_commit
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import update_search_vectors_on_commit
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    """Сбрасывает кэш тегов."""
+
+    bump_version_on_commit('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    """Сбрасывает кэш и индекс автодополнения ингредиентов."""
+
+    bump_version_on_commit('ingredients')
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """Обновляет поиск по рецептам, в которых есть изменённый ингредиент."""
+
+    if created:
+        return
+    update_search_vectors_on_commit(Recipe.objects.filter(
+        ingredients=instance
+    ).values_list('id', flat=True))
+    bump_version_on_commit('recipes')
@@ -0,0 +1,1062 @@
+import asyncio
+import base64
+import csv
+import io
+import os
+import threading
+from datetime import datetime, timedelta
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from api.cache import LOG_ENTRY_KEY, bump_version, get_version
+from api.connections import check_persistent_connections
+from api.indexes import (IngredientAutocompleteIndex, RecipeIngredientIndex,
+                         RecipeSearchIndex)
+from api.middleware import QueryBudgetExceeded
+from api.user_state import UserState, get_user_state, invalidate_user_state
+from api.views import RecipesViewSet
+from foodgram.wsgi_to_asgi import BufferedWsgiToAsgi
+from recipes.feed import rebuild_feed
+from recipes.image_processing import process_recipe_image
+from recipes.models import (FeedEntry, Ingredient, IngredientsInRecipe, Recipe,
+                            RecipeScore, ScoreEvent, ShoppingListItem, Tag,
+                            UnitConversion)
+from recipes.scores import (decayed, log2_sum, refresh_scores, score_added,
+                            score_removed)
+from recipes.shopping_list import get_shopping_list
+from recipes.storage import UPLOADS_DIRECTORY
+from recipes.thumbnails import (THUMBNAIL_FORMATS, generate_thumbnails,
+                                get_thumbnail_name)
+
+User = get_user_model()
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+def run_on_commit():
+    """
+    Выполняет колбэки transaction.on_commit сразу: TestCase
+    не фиксирует транзакции.
+    """
+    return mock.patch.object(
+        transaction, 'on_commit', side_effect=lambda func: func()
+    )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class APITestCase(TestCase):
+    """
+    Общие данные тестов API: теги, ингредиенты, автор и пользователь
+    с токеном. Кэш очищается перед каждым тестом, поэтому запросы
+    к БД считаются для холодного кэша.
+    """
+
+    recipes_count = 0
+    ingredients_per_recipe = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(2)
+        )
+        cls.tags = list(Tag.objects.order_by('id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(40)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Автор', last_name='Рецептов',
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com',
+            password='password', first_name='Имя', last_name='Фамилия',
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipes = [
+            cls.create_recipe(cls.author, f'Рецепт {number}')
+            for number in range(cls.recipes_count)
+        ]
+
+    @classmethod
+    def create_recipe(cls, author, name, ingredients=None):
+        # Картинка не обработана, поэтому миниатюры не запрашиваются.
+        recipe = Recipe.objects.create(
+            author=author,
+            name=name,
+            text='Описание',
+            image='recipes/image.jpg',
+            image_status=Recipe.IMAGE_PROCESSING,
+            cooking_time=10,
+        )
+        recipe.tags.set(cls.tags)
+        if ingredients is None:
+            ingredients = [
+                (ingredient, 10)
+                for ingredient in cls.ingredients[
+                    :cls.ingredients_per_recipe
+                ]
+            ]
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=recipe, ingredients=ingredient, amount=amount
+            )
+            for ingredient, amount in ingredients
+        )
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeQueryCountTest(APITestCase):
+    """Число запросов к БД не зависит от количества рецептов на странице."""
+
+    recipes_count = 50
+
+    def setUp(self):
+        super().setUp()
+        self.recipes[0].favorite.add(self.user)
+        self.recipes[1].cart.add(self.user)
+
+    def get(self, client, path, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_anonymous(self):
+        for limit in (1, 50):
+            cache.clear()
+            response = self.get(
+                self.anonymous, f'/api/recipes/?limit={limit}', 4
+            )
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_authenticated(self):
+        for limit in (1, 50):
+            cache.clear()
+            response = self.get(
+                self.client, f'/api/recipes/?limit={limit}', 8
+            )
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_detail_anonymous(self):
+        self.get(self.anonymous, f'/api/recipes/{self.recipes[0].id}/', 4)
+
+    def test_detail_authenticated(self):
+        response = self.get(
+            self.client, f'/api/recipes/{self.recipes[0].id}/', 8
+        )
+        self.assertTrue(response.json()['is_favorited'])
+
+    def test_ready_images(self):
+        # Адреса миниатюр обработанных картинок вычисляются без запросов.
+        Recipe.objects.update(image_status=Recipe.IMAGE_READY)
+        for client, queries in ((self.anonymous, 4), (self.client, 8)):
+            for limit in (1, 50):
+                cache.clear()
+                response = self.get(
+                    client, f'/api/recipes/?limit={limit}', queries
+                )
+                results = response.json()['results']
+                self.assertEqual(len(results), limit)
+                self.assertTrue(all(
+                    recipe['thumbnail'].endswith(
+                        '/thumbnails/card/recipes/image.jpg'
+                    )
+                    for recipe in results
+                ))
+
+
+class APIWriteTestCase(APITestCase):
+    """Тесты, которые сохраняют картинки рецептов во временный каталог."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        output = io.BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(output, 'PNG')
+        cls.image = (
+            'data:image/png;base64,'
+            + base64.b64encode(output.getvalue()).decode()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def recipe_data(self, ingredients):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+        }
+
+
+class RecipeWriteQueryCountTest(APIWriteTestCase):
+    """
+    Число запросов к БД при создании рецепта с 30 ингредиентами
+    и при изменении, которое удаляет, добавляет и меняет ингредиенты.
+    """
+
+    recipes_count = 1
+
+    def test_create(self):
+        data = self.recipe_data(
+            (ingredient, 10) for ingredient in self.ingredients[:30]
+        )
+        with self.assertNumQueries(19):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(response.json()['ingredients']), 30)
+
+    def test_update_ingredients(self):
+        recipe = self.create_recipe(
+            self.user, 'Рецепт',
+            [(ingredient, 10) for ingredient in self.ingredients[:30]],
+        )
+        # 10 ингредиентов удаляются, 10 добавляются, 10 меняются.
+        ingredients = [
+            (ingredient, 10) for ingredient in self.ingredients[10:20]
+        ] + [
+            (ingredient, 20) for ingredient in self.ingredients[20:40]
+        ]
+        data = self.recipe_data(ingredients)
+        del data['image']
+        with self.assertNumQueries(21):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            {
+                (item['id'], item['amount'])
+                for item in response.json()['ingredients']
+            },
+            {(ingredient.id, amount) for ingredient, amount in ingredients},
+        )
+
+
+class ImageProcessingTest(APIWriteTestCase):
+    """Обработка картинки создаёт миниатюры под постоянными именами."""
+
+    def test_thumbnails(self):
+        output = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(output, 'PNG')
+        storage = Recipe._meta.get_field('image').storage
+        recipe = self.create_recipe(self.author, 'Рецепт')
+        recipe.image = storage.save(
+            f'recipes/{UPLOADS_DIRECTORY}/image.png',
+            ContentFile(output.getvalue()),
+        )
+        recipe.save()
+        process_recipe_image(recipe.id)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
+        for size, dimensions in settings.RECIPE_THUMBNAILS.items():
+            for thumbnail_format in THUMBNAIL_FORMATS:
+                name = get_thumbnail_name(
+                    recipe.image.name, size, thumbnail_format
+                )
+                with storage.open(name, 'rb') as file:
+                    thumbnail = Image.open(file)
+                    self.assertEqual(
+                        '%dx%d' % thumbnail.size, dimensions
+                    )
+                    self.assertEqual(thumbnail.format, thumbnail_format)
+        response = self.anonymous.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.json()['thumbnail'].endswith(
+            storage.url(get_thumbnail_name(recipe.image.name, 'card'))
+        ))
+
+
+class ImageStorageTest(APIWriteTestCase):
+    """
+    Одинаковые картинки хранятся в одном файле, а collect_image_garbage
+    удаляет только давно не сохранявшиеся файлы без рецептов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def save_image(self, color, name='recipes/image.png'):
+        output = io.BytesIO()
+        Image.new('RGB', (400, 300), color).save(output, 'PNG')
+        return self.storage.save(name, ContentFile(output.getvalue()))
+
+    def make_old(self, name):
+        old = time.time() - 2 * 3600
+        os.utime(self.storage.path(name), (old, old))
+
+    def test_same_content(self):
+        name = self.save_image('red')
+        self.assertTrue(name.startswith('recipes/'))
+        self.assertTrue(name.endswith('.png'))
+        self.make_old(name)
+        self.assertEqual(self.save_image('red', 'recipes/other.PNG'), name)
+        self.assertGreater(
+            os.path.getmtime(self.storage.path(name)), time.time() - 60
+        )
+        self.assertNotEqual(self.save_image('blue'), name)
+
+    def test_collect_garbage(self):
+        referenced, orphan, young = (
+            self.save_image(color) for color in ('red', 'green', 'blue')
+        )
+        for name in (referenced, orphan):
+            self.make_old(name)
+        generate_thumbnails(Recipe(image=orphan).image)
+        thumbnail = get_thumbnail_name(orphan, 'card')
+        self.assertTrue(self.storage.exists(thumbnail))
+        Recipe.objects.filter(pk=self.create_recipe(
+            self.author, 'Рецепт'
+        ).pk).update(image=referenced)
+        call_command(
+            'collect_image_garbage', dry_run=True, stdout=io.StringIO()
+        )
+        self.assertTrue(self.storage.exists(orphan))
+        call_command('collect_image_garbage', stdout=io.StringIO())
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertTrue(self.storage.exists(young))
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertFalse(self.storage.exists(thumbnail))
+
+
+@override_settings(PROFILING_ENABLED=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(APIWriteTestCase):
+    """
+    Каждое действие с бюджетом запросов к БД (query_budgets вьюсетов)
+    укладывается в него на холодном кэше: при превышении
+    ProfilingMiddleware выбрасывает QueryBudgetExceeded.
+    """
+
+    recipes_count = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # С обработанными картинками в ответах есть адреса миниатюр.
+        Recipe.objects.update(image_status=Recipe.IMAGE_READY)
+
+    def request(self, client, method, path, data=None, status=200):
+        cache.clear()
+        response = getattr(client, method)(path, data, format='json')
+        self.assertEqual(response.status_code, status, path)
+        if response.streaming:
+            # Запросы при чтении тела тоже входят в бюджет.
+            b''.join(response.streaming_content)
+        return response
+
+    def test_recipes(self):
+        recipe = self.recipes[0]
+        ingredients = ','.join(
+            str(ingredient.id) for ingredient in self.ingredients[:3]
+        )
+        for client in (self.anonymous, self.client):
+            self.request(client, 'get', '/api/recipes/')
+            self.request(client, 'get', f'/api/recipes/{recipe.id}/')
+            self.request(
+                client, 'get', f'/api/recipes/cook/?ingredients={ingredients}'
+            )
+        self.request(
+            self.client, 'post', f'/api/users/{self.author.id}/subscribe/',
+            status=201,
+        )
+        self.request(self.client, 'get', '/api/recipes/feed/')
+        for action in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{recipe.id}/{action}/'
+            self.request(self.client, 'post', path, status=201)
+        self.request(self.client, 'get', '/api/recipes/shopping_list/')
+        self.request(
+            self.client, 'get', '/api/recipes/download_shopping_cart/'
+        )
+        for action in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{recipe.id}/{action}/'
+            self.request(self.client, 'delete', path, status=204)
+
+    def test_recipe_writes(self):
+        data = self.recipe_data(
+            (ingredient, 10) for ingredient in self.ingredients[:30]
+        )
+        response = self.request(
+            self.client, 'post', '/api/recipes/', data, status=201
+        )
+        path = f'/api/recipes/{response.json()["id"]}/'
+        data = self.recipe_data(
+            (ingredient, 20) for ingredient in self.ingredients[10:40]
+        )
+        self.request(self.client, 'put', path, data)
+        del data['image']
+        data['ingredients'] = data['ingredients'][10:]
+        self.request(self.client, 'patch', path, data)
+        self.request(self.client, 'delete', path, status=204)
+
+    def test_users(self):
+        self.user.subscribe.add(self.author)
+        self.request(self.anonymous, 'get', '/api/users/')
+        self.request(self.client, 'get', '/api/users/')
+        self.request(self.client, 'get', f'/api/users/{self.author.id}/')
+        self.request(self.client, 'get', '/api/users/me/')
+        self.request(self.client, 'get', '/api/users/subscriptions/')
+
+    def test_streaming_body_is_profiled(self):
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        budgets = {**RecipesViewSet.query_budgets, 'download_shopping_cart': 2}
+        with mock.patch.object(RecipesViewSet, 'query_budgets', budgets):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/'
+            )
+            with self.assertRaises(QueryBudgetExceeded):
+                b''.join(response.streaming_content)
+
+    def test_server_timing_for_staff_only(self):
+        response = self.request(self.client, 'get', '/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.request(self.client, 'get', '/api/recipes/')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+
+class ConditionalRecipeTest(APITestCase):
+    """Условные запросы страницы рецепта."""
+
+    recipes_count = 1
+
+    def test_anonymous(self):
+        path = f'/api/recipes/{self.recipes[0].id}/'
+        response = self.anonymous.get(path)
+        response = self.anonymous.get(
+            path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_state_change(self):
+        path = f'/api/recipes/{self.recipes[0].id}/'
+        response = self.client.get(path)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        with run_on_commit():
+            self.client.post(f'{path}favorite/')
+        response = self.client.get(
+            path,
+            HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+        response = self.client.get(
+            path, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class IngredientAutocompleteIndexTest(SimpleTestCase):
+    """Автодополнение: сначала совпадения по началу, затем по подстроке."""
+
+    def test_search(self):
+        index = IngredientAutocompleteIndex()
+        index.build(
+            Ingredient(name=name)
+            for name in ('Сахар', 'Ванильный сахар', 'Соль', 'сахарин')
+        )
+        self.assertEqual(
+            [item.name for item in index.search('сах')],
+            ['Сахар', 'сахарин', 'Ванильный сахар'],
+        )
+        self.assertEqual(len(index.search('сах', limit=2)), 2)
+        self.assertEqual(index.search('перец'), [])
+
+    def test_rebuild_replaces_snapshot(self):
+        index = IngredientAutocompleteIndex()
+        index.build([Ingredient(name='Мука')])
+        snapshot = index._data
+        index.build([Ingredient(name='Молоко'), Ingredient(name='Мёд')])
+        self.assertEqual(len(snapshot[0]), 1)
+        self.assertEqual(
+            [item.name for item in index.search('м')], ['Мёд', 'Молоко']
+        )
+
+
+class RecipeSearchIndexTest(APITestCase):
+    """
+    Поиск без PostgreSQL: индекс обновляется только для изменённых
+    рецептов, а из БД запрашиваются не больше SEARCH_RESULTS_LIMIT.
+    """
+
+    recipes_count = 30
+
+    def test_incremental_update(self):
+        index = RecipeSearchIndex()
+        index.ensure_built()
+        recipe, deleted = self.recipes[:2]
+        self.assertIn(deleted.id, index.search('рецепт'))
+        recipe.name = 'Борщ'
+        recipe.save()
+        with run_on_commit():
+            deleted.delete()
+        with mock.patch.object(
+            Recipe.objects, 'values_list', side_effect=AssertionError
+        ), mock.patch.object(index, 'build') as build:
+            index.ensure_built()
+        build.assert_not_called()
+        self.assertEqual(list(index.search('борщ')), [recipe.id])
+        ranks = index.search('рецепт')
+        self.assertNotIn(recipe.id, ranks)
+        self.assertNotIn(deleted.id, ranks)
+        self.assertEqual(len(ranks), self.recipes_count - 2)
+
+    @override_settings(SEARCH_RESULTS_LIMIT=5)
+    def test_results_limit(self):
+        response = self.anonymous.get('/api/recipes/?search=рецепт&limit=50')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [recipe.id for recipe in self.recipes[:-6:-1]],
+        )
+
+    def test_cursor_pagination(self):
+        url = '/api/recipes/?pagination=cursor&limit=5'
+        response = self.anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [recipe.id for recipe in self.recipes[:-6:-1]],
+        )
+        for query in ('search=рецепт', 'ordering=popular'):
+            response = self.anonymous.get(f'{url}&{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class RecipeIngredientIndexTest(APITestCase):
+    """Подбор рецептов по ингредиентам."""
+
+    recipes_count = 10
+
+    def test_incremental_update(self):
+        index = RecipeIngredientIndex()
+        index.ensure_built()
+        first, second = self.ingredients[:2]
+        recipe, deleted = self.recipes[:2]
+        recipe.ingredientsinrecipe_set.filter(ingredients=first).delete()
+        recipe.save()
+        with run_on_commit():
+            deleted.delete()
+        with mock.patch.object(index, 'build') as build:
+            index.ensure_built()
+        build.assert_not_called()
+        matches = {
+            recipe_id: (matched, missing)
+            for recipe_id, matched, missing in index.search([first.id])
+        }
+        self.assertEqual(len(matches), self.recipes_count - 2)
+        self.assertNotIn(recipe.id, matches)
+        self.assertEqual(matches[self.recipes[2].id], (1, 2))
+        self.assertEqual(
+            index.search([first.id, second.id])[0],
+            (self.recipes[-1].id, 2, 1),
+        )
+        matches = index.search([first.id, second.id])
+        self.assertEqual(matches[2:5], list(matches)[2:5])
+
+    def test_rebuild_without_log(self):
+        index = RecipeIngredientIndex()
+        index.ensure_built()
+        with run_on_commit():
+            self.recipes[0].delete()
+        cache.delete(LOG_ENTRY_KEY.format('recipe-index', 1))
+        with mock.patch.object(
+            index, 'build', wraps=index.build
+        ) as build:
+            index.ensure_built()
+        build.assert_called_once()
+        self.assertEqual(
+            len(index.search([self.ingredients[0].id])),
+            self.recipes_count - 1,
+        )
+
+    def test_default_page_size(self):
+        ingredients = ','.join(
+            str(ingredient.id) for ingredient in self.ingredients[:3]
+        )
+        response = self.anonymous.get(
+            f'/api/recipes/cook/?ingredients={ingredients}'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.recipes_count)
+        self.assertEqual(len(response.json()['results']), 6)
+
+
+class FeedTest(APITestCase):
+    """
+    Лента подписок: записи ленты и рецепты популярного автора
+    сливаются по дате публикации без повторов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.popular = User.objects.create_user(
+            username='popular', email='popular@example.com',
+            password='password',
+        )
+        for number in range(5):
+            cls.create_recipe(cls.author, f'Рецепт {number}')
+            cls.create_recipe(cls.popular, f'Популярный рецепт {number}')
+        cls.user.subscribe.add(cls.author, cls.popular)
+        User.objects.filter(pk=cls.popular.pk).update(
+            subscribers_count=settings.FEED_FANOUT_LIMIT + 1
+        )
+        rebuild_feed(cls.user)
+        # Запись, оставшаяся с тех пор, когда автор ещё не был популярным.
+        recipe = cls.popular.recipes.earliest('pub_date')
+        FeedEntry.objects.create(
+            user=cls.user, recipe=recipe, pub_date=recipe.pub_date
+        )
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def test_page(self):
+        response = self.client.get('/api/recipes/feed/?limit=3&page=2')
+        self.assertEqual(response.json()['count'], 10)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            self.expected[3:6],
+        )
+
+    def test_cursor(self):
+        found = []
+        url = '/api/recipes/feed/?pagination=cursor&limit=4'
+        while url:
+            response = self.client.get(url).json()
+            found.extend(recipe['id'] for recipe in response['results'])
+            url = response['next']
+        self.assertEqual(found, self.expected)
+
+    def test_filtered(self):
+        response = self.client.get(
+            '/api/recipes/feed/?tags=tag0&search=популярный&limit=10'
+        )
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [
+                recipe_id for recipe_id in self.expected
+                if Recipe.objects.get(pk=recipe_id).author == self.popular
+            ],
+        )
+
+
+class ShoppingListTest(APITestCase):
+    """
+    Список покупок в JSON и в скачиваемом файле строится одним запросом:
+    количество продукта в разных единицах складывается в канонической.
+    """
+
+    def test_units(self):
+        amounts = (
+            ('Мука', 'кг', 2), ('Мука', 'г', 300),
+            ('Молоко', 'л', 1), ('Молоко', 'мл', 250),
+            ('Шафран', 'мг', 500), ('Шафран', 'г', 1),
+            ('Соль', 'ст. л.', 2),
+        )
+        recipe = self.create_recipe(self.author, 'Рецепт', [
+            (Ingredient.objects.create(name=name, measurement_unit=unit),
+             amount)
+            for name, unit, amount in amounts
+        ])
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        expected = [
+            ('Молоко', 1250, 'мл'),
+            ('Мука', 2300, 'г'),
+            ('Соль', 2, 'ст. л.'),
+            ('Шафран', 1.5, 'г'),
+        ]
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(
+            [
+                (item['name'], item['amount'], item['measurement_unit'])
+                for item in response.json()
+            ],
+            expected,
+        )
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?filetype=csv'
+        )
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))[1:]
+        self.assertEqual(
+            [(name, float(amount), unit) for name, amount, unit in rows],
+            expected,
+        )
+
+    def test_pdf(self):
+        recipe = self.create_recipe(self.author, 'Рецепт', [
+            (ingredient, 10) for ingredient in self.ingredients
+        ])
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?filetype=pdf'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename=user_shopping_list.pdf',
+        )
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        # Все ингредиенты не помещаются на одну страницу.
+        self.assertIn(b'/Count 2', content)
+
+    def test_ingredients_csv_units(self):
+        filename = os.path.join(
+            settings.BASE_DIR, 'static', 'ingredients.csv'
+        )
+        with open(filename, encoding='utf-8') as file:
+            units = {row[1] for row in csv.reader(file)}
+        conversions = {
+            conversion.unit: conversion
+            for conversion in UnitConversion.objects.all()
+        }
+        self.assertTrue({'кг', 'л'} <= units & set(conversions))
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user=self.user,
+                ingredient=Ingredient.objects.create(
+                    name=f'Продукт {unit}', measurement_unit=unit
+                ),
+                amount=3,
+            )
+            for unit in units
+        )
+        rows = {
+            row['ingredient']: (row['measure'], row['amount'])
+            for row in get_shopping_list(self.user)
+        }
+        self.assertEqual(len(rows), len(units))
+        for unit in units:
+            conversion = conversions.get(unit)
+            if conversion is None:
+                expected = (unit, 3)
+            else:
+                expected = (conversion.canonical_unit, 3 * conversion.factor)
+            self.assertEqual(rows[f'Продукт {unit}'], expected, unit)
+
+    def test_concurrent_add(self):
+        recipe = self.create_recipe(self.author, 'Рецепт')
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        def wait_for_lock(user):
+            # Параллельный запрос успевает завершиться, пока ждём блокировку.
+            with mock.patch('api.views.lock_user'):
+                other.post(url)
+
+        with mock.patch('api.views.lock_user', side_effect=wait_for_lock):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.carts_count, 1)
+        self.assertEqual(
+            [row['amount'] for row in get_shopping_list(self.user)],
+            [10] * self.ingredients_per_recipe,
+        )
+
+
+class RecipeScoreTest(APITestCase):
+    """Тренд учитывает время добавления и не растёт от повторов."""
+
+    recipes_count = 2
+
+    def get_score(self, recipe):
+        return RecipeScore.objects.get(recipe=recipe)
+
+    def test_toggle_does_not_raise_trending(self):
+        recipe = self.recipes[0]
+        initial = self.get_score(recipe)
+        score_added(recipe.id, self.user.id, ScoreEvent.FAVORITE)
+        added = self.get_score(recipe)
+        self.assertEqual(added.popularity, 1)
+        self.assertGreater(added.trending, initial.trending)
+        for _ in range(10):
+            score_removed(recipe.id, self.user.id, ScoreEvent.FAVORITE)
+            score_added(recipe.id, self.user.id, ScoreEvent.FAVORITE)
+        score_removed(recipe.id, self.user.id, ScoreEvent.FAVORITE)
+        removed = self.get_score(recipe)
+        self.assertEqual(removed.popularity, 0)
+        self.assertAlmostEqual(removed.trending, initial.trending, places=6)
+        self.assertFalse(ScoreEvent.objects.exists())
+
+    def test_removal_subtracts_original_contribution(self):
+        recipe = self.recipes[0]
+        added_at = datetime.now() - timedelta(days=30)
+        with mock.patch('recipes.scores.dt') as clock:
+            clock.now.return_value = added_at
+            score_added(recipe.id, self.user.id, ScoreEvent.CART)
+        before = self.get_score(recipe).trending
+        score_added(recipe.id, self.author.id, ScoreEvent.CART)
+        score_removed(recipe.id, self.user.id, ScoreEvent.CART)
+        expected = log2_sum(
+            decayed(1, recipe.pub_date), decayed(1, datetime.now())
+        )
+        self.assertAlmostEqual(
+            self.get_score(recipe).trending, expected, places=3
+        )
+        self.assertLess(before, expected)
+
+    def test_refresh_scores(self):
+        first, second = self.recipes
+        RecipeScore.objects.filter(recipe=second).delete()
+        # Добавление без события и событие без добавления.
+        first.favorite.add(self.user)
+        ScoreEvent.objects.create(
+            recipe=first, user=self.author, kind=ScoreEvent.CART,
+            added_at=datetime.now(),
+        )
+        Recipe.objects.filter(pk=first.pk).update(favorites_count=1)
+        self.assertEqual(refresh_scores(), 1)
+        event = ScoreEvent.objects.get()
+        self.assertEqual(
+            (event.recipe, event.user, event.kind, event.added_at),
+            (first, self.user, ScoreEvent.FAVORITE, first.pub_date),
+        )
+        score = self.get_score(first)
+        self.assertEqual(score.popularity, 1)
+        self.assertAlmostEqual(
+            score.trending, decayed(2, first.pub_date), places=6
+        )
+        self.assertAlmostEqual(
+            self.get_score(second).trending,
+            decayed(1, second.pub_date),
+            places=6,
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VersionBumpTest(TransactionTestCase):
+    """Версия пространства имён меняется один раз после фиксации."""
+
+    def test_bump_once_after_commit(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        )
+        version = get_version('ingredients')
+        with mock.patch(
+            'api.cache.bump_version', wraps=bump_version
+        ) as bump:
+            with transaction.atomic():
+                Ingredient.objects.all().delete()
+                Ingredient.objects.create(name='Соль', measurement_unit='г')
+                self.assertEqual(get_version('ingredients'), version)
+            bump.assert_called_once_with('ingredients')
+        self.assertNotEqual(get_version('ingredients'), version)
+
+    def test_no_bump_after_rollback(self):
+        version = get_version('tags')
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Tag.objects.create(name='Тег', color='#000000', slug='tag')
+                raise ValueError
+        self.assertEqual(get_version('tags'), version)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchVectorUpdateTest(TransactionTestCase):
+    """Поисковые векторы обновляются после фиксации одним запросом."""
+
+    def test_update_once_after_commit(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        with mock.patch(
+            'recipes.search.full_text_search_available', return_value=True
+        ), mock.patch('recipes.search.update_search_vectors') as update:
+            with transaction.atomic():
+                recipes = [
+                    Recipe.objects.create(
+                        author=author, name=f'Рецепт {number}',
+                        text='Описание', image='recipes/image.jpg',
+                        cooking_time=10,
+                    )
+                    for number in range(2)
+                ]
+                IngredientsInRecipe.objects.create(
+                    recipe=recipes[0], ingredients=salt, amount=5
+                )
+                update.assert_not_called()
+            update.assert_called_once_with({recipe.id for recipe in recipes})
+            update.reset_mock()
+            with transaction.atomic():
+                salt.name = 'Морская соль'
+                salt.save()
+            update.assert_called_once_with({recipes[0].id})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserStateTest(TransactionTestCase):
+    """Состояние, загруженное до изменения, не сохраняется после сброса."""
+
+    def test_stale_state_is_not_reused(self):
+        cache.clear()
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='Описание',
+            image='recipes/image.jpg', cooking_time=10,
+        )
+        load = UserState.load
+
+        def load_during_write(loaded_user):
+            # Пользователь добавляет рецепт в избранное, пока состояние
+            # загружается параллельным запросом.
+            try:
+                return load(loaded_user)
+            finally:
+                recipe.favorite.add(user)
+                invalidate_user_state(user)
+
+        with mock.patch.object(
+            UserState, 'load', side_effect=load_during_write
+        ):
+            stale = get_user_state(User.objects.get(pk=user.pk))
+        self.assertNotIn(recipe.id, stale.favorites)
+        state = get_user_state(User.objects.get(pk=user.pk))
+        self.assertIn(recipe.id, state.favorites)
+
+
+@override_settings(
+    DB_CONN_HEALTH_CHECKS=True, DB_CONN_HEALTH_CHECK_INTERVAL=10
+)
+class ConnectionHealthCheckTest(TestCase):
+    """Постоянное соединение проверяется не чаще раза в интервал."""
+
+    def test_interval(self):
+        connection = connections['default']
+        connection.ensure_connection()
+        connection.__dict__.pop('health_checked', None)
+        with mock.patch.object(
+            connection, 'is_usable', return_value=True
+        ) as is_usable, mock.patch('api.connections.time') as clock:
+            clock.monotonic.return_value = 100
+            for _ in range(3):
+                check_persistent_connections(sender=None)
+            self.assertEqual(is_usable.call_count, 1)
+            clock.monotonic.return_value = 111
+            check_persistent_connections(sender=None)
+            self.assertEqual(is_usable.call_count, 2)
+            is_usable.return_value = False
+            clock.monotonic.return_value = 122
+            with mock.patch.object(connection, 'close') as close:
+                check_persistent_connections(sender=None)
+            close.assert_called_once_with()
+
+
+class BufferedWsgiToAsgiTest(SimpleTestCase):
+    """
+    Обычный ответ отдаётся целиком из буфера, потоковый - по блокам
+    до того, как приложение сгенерирует его до конца.
+    """
+
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/',
+        'query_string': b'',
+        'http_version': '1.1',
+        'headers': [],
+    }
+
+    def call(self, response, on_send=None):
+        def wsgi_application(environ, start_response):
+            start_response(
+                f'{response.status_code} {response.reason_phrase}',
+                list(response.items()),
+            )
+            return response
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            self.messages.append(message)
+            if on_send is not None:
+                on_send(message)
+
+        application = BufferedWsgiToAsgi(wsgi_application)
+        self.addCleanup(application.executor.shutdown)
+        self.messages = []
+        asyncio.run(application(self.scope, receive, send))
+
+    def test_buffered(self):
+        self.call(HttpResponse(b'x' * 100_000))
+        self.assertEqual(self.messages[0]['status'], 200)
+        self.assertEqual(
+            b''.join(
+                message.get('body', b'') for message in self.messages[1:]
+            ),
+            b'x' * 100_000,
+        )
+
+    def test_streaming(self):
+        first_chunk_sent = threading.Event()
+
+        def content():
+            yield b'first'
+            # Второй блок генерируется только после отправки первого.
+            self.assertTrue(first_chunk_sent.wait(timeout=5))
+            yield b'second'
+
+        def on_send(message):
+            if message.get('body') == b'first':
+                first_chunk_sent.set()
+
+        self.call(StreamingHttpResponse(content()), on_send)
+        self.assertEqual(
+            [message.get('body') for message in self.messages[1:]],
+            [b'first', b'second', None],
+        )
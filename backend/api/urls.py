@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
-from api.views import (CustomUserViewSet, IngredientsViewSet, RecipesViewSet,
-                       TagsViewSet)
+from api.views import (CustomUserViewSet, IngredientsViewSet, MetricsView,
+                       RecipesViewSet, TagsViewSet)
 
 app_name = 'api'
 
@@ -13,6 +13,7 @@ router.register(r'users', CustomUserViewSet, 'users')
 router.register(r'ingredients', IngredientsViewSet)
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,96 @@
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from api.cache import NamespacedCache, bump_version, get_version
+from recipes.models import Recipe
+
+user_state_cache = NamespacedCache(
+    'user-state', timeout=settings.USER_STATE_TIMEOUT, versioned=False
+)
+
+
+class IdSet:
+    """Неизменяемое множество id в виде отсортированного массива чисел."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids):
+        self.ids = ids if isinstance(ids, array) else array('q', sorted(ids))
+
+    def __contains__(self, value):
+        index = bisect_left(self.ids, value)
+        return index < len(self.ids) and self.ids[index] == value
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class UserState:
+    """Избранное, список покупок и подписки пользователя."""
+
+    def __init__(self, favorites, carts, subscriptions):
+        self.favorites = IdSet(favorites)
+        self.carts = IdSet(carts)
+        self.subscriptions = IdSet(subscriptions)
+
+    @classmethod
+    def load(cls, user):
+        """Загружает состояние пользователя из базы данных."""
+        return cls(
+            favorites=Recipe.favorite.through.objects.filter(
+                customuser_id=user.id
+            ).values_list('recipe_id', flat=True),
+            carts=Recipe.cart.through.objects.filter(
+                customuser_id=user.id
+            ).values_list('recipe_id', flat=True),
+            subscriptions=user.subscribe.through.objects.filter(
+                from_customuser_id=user.id
+            ).values_list('to_customuser_id', flat=True),
+        )
+
+    def dump(self):
+        return (self.favorites.ids, self.carts.ids, self.subscriptions.ids)
+
+
+def get_state_namespace(user_id):
+    """
+    Пространство имён версии состояния пользователя. Ключ состояния
+    содержит версию, поэтому состояние, загруженное до изменения
+    и сохранённое после сброса, уже никогда не будет прочитано.
+    """
+    return f'user-state:{user_id}'
+
+
+def get_user_state(user):
+    """
+    Состояние пользователя: загружается один раз за запрос
+    и хранится в кэше до изменения избранного, покупок или подписок.
+    """
+    state = getattr(user, '_recipe_state', None)
+    if state is not None:
+        return state
+    key = f'{user.id}:{get_version(get_state_namespace(user.id))}'
+    cached = user_state_cache.get(key)
+    if cached is not None:
+        state = UserState(*cached)
+    else:
+        state = UserState.load(user)
+        user_state_cache.set(key, state.dump())
+    user._recipe_state = state
+    return state
+
+
+def invalidate_user_state(user):
+    """
+    Сбрасывает закэшированное состояние пользователя после фиксации
+    текущей транзакции.
+    """
+    user.__dict__.pop('_recipe_state', None)
+    transaction.on_commit(
+        lambda: bump_version(get_state_namespace(user.id))
+    )
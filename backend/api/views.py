@@ -1,26 +1,48 @@
-from datetime import datetime as dt
-
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum, Case, When, Value, IntegerField
-from django.db.models.signals import pre_delete
-from django.dispatch.dispatcher import receiver
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from api.filters import RecipeFilter
+from api.indexes import ingredient_index, recipe_ingredient_index
+from api.metrics import render_prometheus
+from api.mixins import CachedListMixin, ConditionalRecipeMixin
 from api.pagination import CustomPagination
 from api.permissions import IsAdminOrAuthorOrReadOnly, AdminOrReadOnly
-from api.serializers import (CustomUserSerializer, IngredientsSerializer,
-                             RecipesSerializer, RecipesShortSerializer,
-                             SubscribeSerializer, TagsSerializer)
+from api.serializers import (CookRecipeSerializer, CustomUserSerializer,
+                             IngredientsSerializer, RecipesSerializer,
+                             RecipesShortSerializer,
+                             ShoppingListItemSerializer, SubscribeSerializer,
+                             TagsSerializer)
+from api.shopping_list import SHOPPING_LIST_RENDERERS
+from api.user_state import invalidate_user_state
+from recipes.counters import change_counter
+from recipes.feed import backfill_feed, get_feed, remove_from_feed
+from recipes.image_processing import enqueue_image_processing
 from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from recipes.scores import score_added, score_removed
+from recipes.shopping_list import (add_to_shopping_list, get_shopping_list,
+                                   remove_from_shopping_list)
 
 User = get_user_model()
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+
+def lock_user(user):
+    """
+    Блокирует строку пользователя до конца транзакции, чтобы параллельные
+    запросы одного пользователя проверяли и меняли его списки по очереди.
+    """
+    User.objects.select_for_update().filter(pk=user.id).values('pk').get()
+
 
 class CustomUserViewSet(UserViewSet):
     """Вьюсет модели пользователя."""
@@ -28,6 +50,16 @@ class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    cursor_ordering = ('username',)
+    # Допустимое число запросов к БД по действиям (api.middleware),
+    # измеренное на холодном кэше в api.tests.QueryBudgetTest.
+    query_budgets = {
+        'list': 6,
+        'retrieve': 5,
+        'me': 1,
+        'subscriptions': 7,
+        'subscribe': 16,
+    }
 
     @action(
         methods=['get', ],
@@ -40,7 +72,15 @@ class CustomUserViewSet(UserViewSet):
         user = self.request.user
         if user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        authors = user.subscribe.all()
+        limit = request.query_params.get('recipes_limit')
+        limit = int(limit) if limit and limit.isdecimal() else None
+        authors = user.subscribe.prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_by_author(limit),
+                to_attr='latest_recipes',
+            )
+        )
         pages = self.paginate_queryset(authors)
         serializer = SubscribeSerializer(
             pages,
@@ -60,11 +100,6 @@ class CustomUserViewSet(UserViewSet):
         user = self.request.user
         author = get_object_or_404(User, id=kwargs.get('id'))
         if request.method == 'POST':
-            if user.subscribe.filter(id=author.id).exists():
-                return Response(
-                    {'errors': 'Подписка на этого пользователя уже есть!'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
             if user.id == author.id:
                 return Response(
                     {'errors': 'Нельзя подписаться на самого себя!'},
@@ -76,68 +111,212 @@ class CustomUserViewSet(UserViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            user.subscribe.add(author)
+            with transaction.atomic():
+                lock_user(user)
+                if user.subscribe.filter(id=author.id).exists():
+                    return Response(
+                        {'errors': 'Подписка на этого пользователя уже есть!'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                user.subscribe.add(author)
+                change_counter(User, author.id, 'subscribers_count', 1)
+                backfill_feed(user, author)
+            invalidate_user_state(user)
             response_status = status.HTTP_201_CREATED
             data = serializer.data
         elif request.method == 'DELETE':
-            if not user.subscribe.filter(id=author.id).exists():
-                return Response(
-                    {'errors': 'Подписка на этого пользователя нет!'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            user.subscribe.remove(author)
+            with transaction.atomic():
+                lock_user(user)
+                if not user.subscribe.filter(id=author.id).exists():
+                    return Response(
+                        {'errors': 'Подписка на этого пользователя нет!'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                user.subscribe.remove(author)
+                change_counter(User, author.id, 'subscribers_count', -1)
+                remove_from_feed(user, author)
+            invalidate_user_state(user)
             response_status = status.HTTP_204_NO_CONTENT
             data = None
         return Response(data=data, status=response_status)
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет тегов."""
 
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
     permission_classes = [AdminOrReadOnly, ]
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингридиентов."""
 
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (AdminOrReadOnly,)
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
         """
-        Фильтрация и сортировка ингредиентов по параметру запроса 'name'.
-        В начале выводятся ингредиенты начинающиеся на 'name', затем остальные.
+        Поиск ингредиентов по параметру запроса 'name'.
+        В начале выводятся ингредиенты начинающиеся на 'name', затем
+        содержащие 'name'. Количество подсказок ограничено параметром 'limit'.
         """
-        name = self.request.query_params.get('name')
-        if name:
-            queryset = self.queryset.filter(name__icontains=name)
-            return queryset.annotate(
-                ingr_order=Case(
-                    When(name=name, then=Value(1)),
-                    default=2,
-                    output_field=IntegerField(),
-                )
-            ).order_by('ingr_order')
-        return self.queryset
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        limit = (
+            int(limit) if limit and limit.isdecimal()
+            else settings.INGREDIENTS_SEARCH_LIMIT
+        )
+        ingredient_index.ensure_built()
+        serializer = self.get_serializer(
+            ingredient_index.search(name, limit), many=True
+        )
+        return Response(serializer.data)
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(ConditionalRecipeMixin, viewsets.ModelViewSet):
     """Вьюсет рецептов."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminOrAuthorOrReadOnly, )
     serializer_class = RecipesSerializer
     pagination_class = CustomPagination
+    cursor_ordering = ('-pub_date', '-id')
+    # Допустимое число запросов к БД по действиям (api.middleware),
+    # измеренное на холодном кэше в api.tests.QueryBudgetTest:
+    # страница списка не должна делать запросов на каждый рецепт.
+    query_budgets = {
+        'list': 8,
+        'retrieve': 8,
+        'feed': 10,
+        'cook': 9,
+        'create': 19,
+        'update': 21,
+        'partial_update': 21,
+        'destroy': 15,
+        'favorite': 14,
+        'shopping_cart': 16,
+        'shopping_list': 2,
+        'download_shopping_cart': 3,
+    }
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Рецепты со всеми данными, необходимыми сериализатору: авторы, теги
+        и ингредиенты загружаются фиксированным числом запросов независимо
+        от размера страницы.
+        """
+
+        return Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientsinrecipe_set',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredients'
+                ).order_by('ingredients__name')
+            ),
+        )
+
     def perform_create(self, serializer):
-        """Создание рецепта."""
+        """
+        Создание рецепта. Картинка сохраняется как есть
+        и обрабатывается в фоне.
+        """
+
+        serializer.save(
+            author=self.request.user,
+            image_status=Recipe.IMAGE_PROCESSING,
+        )
+        enqueue_image_processing(serializer.instance.pk)
+        self.refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        """Изменение рецепта. Новая картинка обрабатывается в фоне."""
+
+        if serializer.validated_data.get('image'):
+            serializer.save(image_status=Recipe.IMAGE_PROCESSING)
+            enqueue_image_processing(serializer.instance.pk)
+        else:
+            serializer.save()
+        self.refresh_instance(serializer)
 
-        serializer.save(author=self.request.user)
+    def refresh_instance(self, serializer):
+        """
+        Перечитывает сохранённый рецепт вместе со связанными данными,
+        чтобы ответ формировался без запросов на каждый ингредиент.
+        """
+
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
+        )
+
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+
+        queryset = get_feed(
+            request.user, self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.get_serializer(queryset[:], many=True).data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=False)
+    def cook(self, request):
+        """
+        Рецепты, которые можно приготовить из имеющихся ингредиентов
+        (?ingredients=1,2,3). Сначала идут рецепты с наибольшей долей
+        имеющихся ингредиентов, затем с наименьшим числом недостающих.
+        Параметр max_missing ограничивает число недостающих ингредиентов.
+        """
+
+        values = ','.join(request.query_params.getlist('ingredients'))
+        ingredient_ids = [
+            int(value) for value in values.split(',')
+            if value.strip().isdecimal()
+        ]
+        if not ingredient_ids:
+            return Response(
+                {'errors': 'Не переданы id ингредиентов!'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_missing = request.query_params.get('max_missing')
+        max_missing = (
+            int(max_missing) if max_missing and max_missing.isdecimal()
+            else None
+        )
+        recipe_ingredient_index.ensure_built()
+        matches = recipe_ingredient_index.search(ingredient_ids, max_missing)
+        page = self.paginate_queryset(matches)
+        rows = matches if page is None else page
+        recipes = self.get_queryset().in_bulk([row[0] for row in rows])
+        found = []
+        for recipe_id, matched, missing in rows:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.ingredients_matched = matched
+            recipe.ingredients_missing = missing
+            found.append(recipe)
+        serializer = CookRecipeSerializer(
+            found, many=True, context=self.get_serializer_context()
+        )
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=['post', 'delete'],
@@ -176,32 +355,64 @@ class RecipesViewSet(viewsets.ModelViewSet):
         user = self.request.user
         recipe = get_object_or_404(Recipe, id=pk)
         model_fields = {
-            'cart': recipe.cart,
-            'favorite': recipe.favorite,
+            'cart': (recipe.cart, 'carts_count'),
+            'favorite': (recipe.favorite, 'favorites_count'),
         }
-        m_field = model_fields[model_field]
+        m_field, counter = model_fields[model_field]
 
         if method == 'POST':
-            if m_field.filter(id=user.id).exists():
-                return Response(
-                    {'errors': 'Рецепт уже добавлен!'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
             serializer = RecipesShortSerializer(recipe)
-            m_field.add(user)
+            with transaction.atomic():
+                lock_user(user)
+                if m_field.filter(id=user.id).exists():
+                    return Response(
+                        {'errors': 'Рецепт уже добавлен!'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                m_field.add(user)
+                if model_field == 'cart':
+                    add_to_shopping_list(user.id, recipe.id)
+                change_counter(Recipe, recipe.id, counter, 1)
+                score_added(recipe.id, user.id, model_field)
+            invalidate_user_state(user)
             response_status = status.HTTP_201_CREATED
             data = serializer.data
         elif method == 'DELETE':
-            if not m_field.filter(id=user.id).exists():
-                return Response(
-                    {'errors': 'Рецепт уже удалён!'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            m_field.remove(user)
+            with transaction.atomic():
+                lock_user(user)
+                if not m_field.filter(id=user.id).exists():
+                    return Response(
+                        {'errors': 'Рецепт уже удалён!'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if model_field == 'cart':
+                    remove_from_shopping_list(user.id, recipe.id)
+                m_field.remove(user)
+                change_counter(Recipe, recipe.id, counter, -1)
+                score_removed(recipe.id, user.id, model_field)
+            invalidate_user_state(user)
             response_status = status.HTTP_204_NO_CONTENT
             data = None
         return Response(data=data, status=response_status)
 
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_list(self, request):
+        """
+        Список покупок: ингредиенты рецептов корзины с количеством
+        в тех же единицах измерения, что и в скачиваемом файле.
+        """
+
+        serializer = ShoppingListItemSerializer(
+            get_shopping_list(request.user),
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
     @action(
         methods=('get',),
         detail=False,
@@ -211,35 +422,38 @@ class RecipesViewSet(viewsets.ModelViewSet):
         """Скачивание файла со списком покупок."""
 
         user = request.user
-        if not user.carts.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = IngredientsInRecipe.objects.filter(
-            recipe__in=(user.carts.values('id'))
-        ).values(
-            ingredient=F('ingredients__name'),
-            measure=F('ingredients__measurement_unit')
-        ).annotate(amount=Sum('amount'))
-
-        filename = f'{user.username}_shopping_list.txt'
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n'
-            f'Дата: {dt.today():%d-%m-%Y}\n\n'
-        )
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing["ingredient"]}: {ing["amount"]} {ing["measure"]}\n'
+        renderer_class = SHOPPING_LIST_RENDERERS.get(
+            request.query_params.get('filetype', 'txt')
+        )
+        if renderer_class is None:
+            return Response(
+                {'errors': 'Неподдерживаемый формат файла!'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        shopping_list += '\nПриятного аппетита!'
-
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+        if not user.shopping_list.exists():
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        ingredients = get_shopping_list(user)
+
+        renderer = renderer_class(user)
+        response = StreamingHttpResponse(
+            renderer.render(
+                ingredients.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+            ),
+            content_type=renderer.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={renderer.get_filename()}'
         )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-@receiver(pre_delete, sender=Recipe)
-def recipe_image_delete(sender, instance, **kwargs):
-    """Удаляет файл картинки, при удалении рецепта."""
+class MetricsView(APIView):
+    """Показатели эндпоинтов и кэша процесса в формате Prometheus."""
 
-    instance.image.delete(False)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            render_prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
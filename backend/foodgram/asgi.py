@@ -0,0 +1,23 @@
+"""
+ASGI config for foodgram project.
+
+Django 2.2 does not support ASGI, so the WSGI application is wrapped
+in BufferedWsgiToAsgi: slow clients are served by the event loop and
+Django handles complete requests in a pool of GUNICORN_THREADS threads.
+Streaming responses are passed through chunk by chunk and hold their
+thread until the client has received them.
+
+Run with: GUNICORN_MODE=asgi gunicorn -c gunicorn.conf.py
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from foodgram.wsgi_to_asgi import BufferedWsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+application = BufferedWsgiToAsgi(
+    get_wsgi_application(),
+    threads=int(os.environ.get('GUNICORN_THREADS', 1)),
+)
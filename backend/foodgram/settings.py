@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 import environ
 
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -99,9 +101,38 @@ DATABASES = {
         'PASSWORD': env('POSTGRES_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        # Время жизни (в секундах) постоянного соединения процесса с БД,
+        # 0 - отдельное соединение на каждый запрос.
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
     }
 }
 
+# Проверять постоянное соединение с БД перед его использованием
+# в новом запросе и открывать новое, если соединение разорвано.
+DB_CONN_HEALTH_CHECKS = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+# Минимальный интервал (в секундах) между проверками одного соединения.
+DB_CONN_HEALTH_CHECK_INTERVAL = env.int(
+    'DB_CONN_HEALTH_CHECK_INTERVAL', default=10
+)
+
+
+# Cache
+# Версии данных и закэшированные ответы хранятся в кэше Django и должны
+# быть общими для всех процессов приложения. Кэш задаётся переменной
+# CACHE_URL: rediscache://redis:6379/1 (django-redis из requirements.txt),
+# locmemcache:// и т.д. По умолчанию - файловый кэш во временном каталоге.
+# Для memcache://memcached:11211 нужно дополнительно установить
+# python-memcached: другие клиенты memcached Django 2.2 не поддерживает.
+
+CACHES = {
+    'default': env.cache(
+        'CACHE_URL',
+        default='filecache://' + os.path.join(
+            tempfile.gettempdir(), 'foodgram_cache'
+        ),
+    ),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -150,6 +181,25 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Размеры миниатюр картинок рецептов: карточка в списке рецептов,
+# карточка в подписках и превью в админ-панели.
+RECIPE_THUMBNAILS = {
+    'card': '480x300',
+    'subscription': '150x150',
+    'admin': '100x100',
+}
+THUMBNAIL_QUALITY = 85
+
+# Обработка загруженных картинок рецептов: 'thread' - в фоновом пуле
+# потоков после ответа на запрос, 'sync' - сразу после сохранения рецепта.
+IMAGE_PROCESSING_BACKEND = env('IMAGE_PROCESSING_BACKEND', default='thread')
+IMAGE_PROCESSING_WORKERS = env.int('IMAGE_PROCESSING_WORKERS', default=2)
+# Максимальный размер загружаемого файла (в байтах), большая сторона
+# обработанной картинки (в пикселях) и качество сохранения в JPEG.
+IMAGE_MAX_UPLOAD_SIZE = env.int('IMAGE_MAX_UPLOAD_SIZE', default=10 * 2 ** 20)
+IMAGE_MAX_SIZE = env.int('IMAGE_MAX_SIZE', default=1600)
+IMAGE_QUALITY = 90
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -160,6 +210,41 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Максимальное число подсказок автодополнения ингредиентов.
+INGREDIENTS_SEARCH_LIMIT = env.int('INGREDIENTS_SEARCH_LIMIT', default=30)
+
+# Период (в часах), за который вклад события в тренд рецепта
+# уменьшается вдвое относительно новых событий.
+TRENDING_HALF_LIFE = env.float('TRENDING_HALF_LIFE', default=72)
+
+# Время хранения (в секундах) закэшированных избранного,
+# списка покупок и подписок пользователя.
+USER_STATE_TIMEOUT = env.int('USER_STATE_TIMEOUT', default=600)
+
+# Время (в секундах), в течение которого ответы анонимным пользователям
+# хранятся в общем кэше и могут кэшироваться браузером и nginx.
+ANONYMOUS_CACHE_TIMEOUT = env.int('ANONYMOUS_CACHE_TIMEOUT', default=60)
+
+# Длина ленты подписок и число подписчиков автора, начиная с которого
+# его рецепты не раскладываются по лентам, а добавляются при чтении.
+FEED_LENGTH = env.int('FEED_LENGTH', default=500)
+FEED_FANOUT_LIMIT = env.int('FEED_FANOUT_LIMIT', default=5000)
+
+# Конфигурация полнотекстового поиска PostgreSQL для рецептов.
+SEARCH_CONFIG = env('SEARCH_CONFIG', default='russian')
+
+# Максимальное число рецептов в результатах поиска без PostgreSQL:
+# остальные совпадения отбрасываются до запроса к БД.
+SEARCH_RESULTS_LIMIT = env.int('SEARCH_RESULTS_LIMIT', default=200)
+
+# Профилирование запросов к API: метрики эндпоинтов по адресу /api/metrics/
+# и заголовок Server-Timing с числом и временем запросов к БД (только
+# в режиме DEBUG и для администраторов).
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', default=False)
+# Ошибка вместо предупреждения в логе, если эндпоинт выполнил больше
+# запросов к БД, чем объявлено в query_budgets вьюсета (для тестов).
+QUERY_BUDGET_STRICT = env.bool('QUERY_BUDGET_STRICT', default=False)
+
 DJOSER = {
     'PERMISSIONS': {
         'user': ['djoser.permissions.CurrentUserOrAdminOrReadOnly'],
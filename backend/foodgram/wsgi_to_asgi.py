@@ -0,0 +1,218 @@
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+# Размер блока отправки ответа и объём тела запроса или ответа,
+# который хранится в памяти, прежде чем попасть во временный файл.
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+# Число блоков потокового ответа, которые поток Django может передать
+# в цикл событий, пока клиент не принял предыдущие.
+STREAM_QUEUE_SIZE = 8
+
+
+class StreamAbortedError(Exception):
+    """Цикл событий перестал принимать блоки потокового ответа."""
+
+
+class BufferedWsgiToAsgi:
+    """
+    Приложение ASGI поверх приложения WSGI.
+    Тело запроса читается, а ответ отправляется клиенту в цикле событий,
+    поэтому медленный клиент не занимает поток. В пуле потоков Django
+    обрабатывает только полностью полученный запрос и отдаёт ответ целиком.
+    Потоковые ответы (StreamingHttpResponse) не буферизуются: блоки
+    передаются клиенту по мере генерации, и поток занят, пока клиент
+    не примет ответ целиком.
+    """
+
+    def __init__(self, wsgi_application, threads=1):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='wsgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип ASGI {scope["type"]}')
+        with SpooledTemporaryFile(max_size=SPOOL_SIZE) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            response = await self.run_in_thread(scope, body, send)
+        if response is None:
+            return
+        status, headers, content = response
+        with content:
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': headers,
+            })
+            while True:
+                chunk = content.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body'})
+
+    async def run_in_thread(self, scope, body, send):
+        """
+        Выполняет запрос в пуле потоков. Сообщения потокового ответа
+        поток передаёт через очередь, и они сразу отправляются клиенту.
+        """
+        loop = asyncio.get_event_loop()
+        messages = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stopped = threading.Event()
+
+        def put(message):
+            if message is not None and stopped.is_set():
+                raise StreamAbortedError
+            asyncio.run_coroutine_threadsafe(
+                messages.put(message), loop
+            ).result()
+
+        def run():
+            try:
+                return self.run_wsgi_app(scope, body, put)
+            finally:
+                put(None)
+
+        worker = loop.run_in_executor(self.executor, run)
+        try:
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                await send(message)
+        except BaseException:
+            # Поток дописывает ответ в очередь, пока не заметит остановку.
+            stopped.set()
+            while await messages.get() is not None:
+                pass
+            raise
+        return await worker
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def build_environ(self, scope, body):
+        script_name = scope.get('root_path', '').encode().decode('latin1')
+        path_info = scope['path'].encode().decode('latin1')
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope['query_string'].decode('ascii'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1')
+            value = value.decode('latin1')
+            if name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            elif name == 'content-type':
+                key = 'CONTENT_TYPE'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in environ:
+                separator = '; ' if name == 'cookie' else ','
+                value = environ[key] + separator + value
+            environ[key] = value
+        return environ
+
+    def run_wsgi_app(self, scope, body, put):
+        """
+        Выполняется в пуле потоков. Обычный ответ записывается во временный
+        файл и возвращается как (статус, заголовки, файл), а потоковый
+        передаётся в цикл событий по блокам через put. Закрытие результата
+        приложения отправляет сигнал request_finished, по которому Django
+        закрывает устаревшие соединения с БД.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ]
+
+        result = self.wsgi_application(
+            self.build_environ(scope, body), start_response
+        )
+        try:
+            if getattr(result, 'streaming', False):
+                self.stream_response(response, result, put)
+                return None
+            return (
+                response['status'],
+                response['headers'],
+                self.buffer_response(result),
+            )
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def buffer_response(self, result):
+        content = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            for chunk in result:
+                content.write(chunk)
+        except BaseException:
+            content.close()
+            raise
+        content.seek(0)
+        return content
+
+    def stream_response(self, response, result, put):
+        put({
+            'type': 'http.response.start',
+            'status': response['status'],
+            'headers': response['headers'],
+        })
+        for chunk in result:
+            if chunk:
+                put({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        put({'type': 'http.response.body'})
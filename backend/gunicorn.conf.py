@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+
+# Каждый поток каждого воркера держит своё постоянное соединение с БД
+# (CONN_MAX_AGE), поэтому workers * threads не должно превышать
+# количество соединений, выделенных приложению в PostgreSQL.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 20))
+
+# Режим сервера. 'wsgi' - воркеры gthread: поток занят на всё время
+# получения запроса и отправки ответа, в том числе медленному клиенту.
+# 'asgi' - воркеры uvicorn с foodgram.asgi: запрос и ответ передаются
+# в цикле событий, а поток занят только обработкой запроса в Django.
+MODE = os.environ.get('GUNICORN_MODE', 'wsgi')
+if MODE == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    worker_class = 'gthread'
+
+bind = os.environ.get('GUNICORN_BIND', '0:8000')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+workers = int(os.environ.get(
+    'GUNICORN_WORKERS',
+    max(1, min(multiprocessing.cpu_count() * 2 + 1, DB_POOL_SIZE // threads))
+))
+
+
+def on_starting(server):
+    connections = workers * threads
+    server.log.info(
+        'Режим: %s, воркеров: %s, потоков: %s, соединений с БД: до %s из %s',
+        MODE, workers, threads, connections, DB_POOL_SIZE
+    )
+    if connections > DB_POOL_SIZE:
+        server.log.warning(
+            'Количество соединений с БД превышает DB_POOL_SIZE=%s',
+            DB_POOL_SIZE
+        )
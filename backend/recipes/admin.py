@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
-from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from recipes.models import (Ingredient, IngredientsInRecipe, Recipe, Tag,
+                            UnitConversion)
+from recipes.shopping_list import apply_recipe
+from recipes.thumbnails import get_thumbnail_url
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -36,6 +39,21 @@ class IngredientAdmin(admin.ModelAdmin):
     )
 
 
+class UnitConversionAdmin(admin.ModelAdmin):
+    """Отображение модели перевода единиц измерения в админ-панели."""
+
+    list_display = (
+        'id',
+        'unit',
+        'canonical_unit',
+        'factor',
+    )
+    list_display_links = (
+        'id',
+        'unit',
+    )
+
+
 class IngredientsInRecipeInLine(admin.TabularInline):
     """Отображение модели ингридиентов в админ-модели рецептов."""
 
@@ -53,11 +71,12 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author',
         'tags',
+        'image_status',
     )
 
     def get_num_of_uses(self, obj):
         """Подсчёт количества добавления рецепта в избранное."""
-        return obj.favorite_recipes.count()
+        return obj.favorites_count
 
     get_num_of_uses.short_description = (
         'Количество добавления рецепта в избранное'
@@ -67,6 +86,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'id',
         'name',
         'author',
+        'image_status',
         'preview_images',
     )
 
@@ -94,7 +114,11 @@ class RecipeAdmin(admin.ModelAdmin):
     def preview_images(self, obj):
         """Превью картинки на странице модели."""
 
-        return mark_safe(f'<img src="{obj.image.url}" width=50>')
+        if obj.image_status != Recipe.IMAGE_READY:
+            return obj.get_image_status_display()
+        return mark_safe(
+            f'<img src="{get_thumbnail_url(obj.image, "admin")}">'
+        )
 
     def preview_image(self, obj):
         """Превью картинки на странице экземпляра модели."""
@@ -104,7 +128,18 @@ class RecipeAdmin(admin.ModelAdmin):
     preview_images.short_description = "Миниатюра"
     preview_image.short_description = "Миниатюра"
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Пересчитывает списки покупок с рецептом, ингредиенты которого
+        могли измениться.
+        """
+
+        apply_recipe(form.instance.id, -1)
+        super().save_related(request, form, formsets, change)
+        apply_recipe(form.instance.id, 1)
+
 
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(UnitConversion, UnitConversionAdmin)
 admin.site.register(Recipe, RecipeAdmin)
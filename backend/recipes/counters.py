@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Recipe
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик field объекта на delta."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_related(queryset, field):
+    """Подзапрос количества строк queryset, ссылающихся на объект."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def get_counters():
+    """Описание счётчиков: модель, поле, связанные строки и ссылка на них."""
+    user_model = get_user_model()
+    return (
+        (Recipe, 'favorites_count', Recipe.favorite.through.objects, 'recipe'),
+        (Recipe, 'carts_count', Recipe.cart.through.objects, 'recipe'),
+        (user_model, 'recipes_count', Recipe.objects, 'author'),
+        (
+            user_model,
+            'subscribers_count',
+            user_model.subscribe.through.objects,
+            'to_customuser',
+        ),
+    )
+
+
+def repair_counters():
+    """
+    Пересчитывает все счётчики по связанным таблицам.
+    Возвращает количество исправленных записей для каждого счётчика.
+    """
+    repaired = {}
+    for model, field, related, lookup in get_counters():
+        actual = count_related(related.all(), lookup)
+        stale = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', flat=True)
+        repaired[f'{model._meta.model_name}.{field}'] = (
+            model.objects.filter(pk__in=list(stale)).update(**{field: actual})
+        )
+    return repaired
@@ -0,0 +1,16 @@
+# Словари для синтетических рецептов: generate_data и бенчмарки поиска.
+
+DISHES = (
+    'суп', 'борщ', 'салат', 'запеканка', 'пирог', 'омлет', 'каша', 'рагу',
+    'паста', 'плов', 'котлеты', 'блины', 'оладьи', 'соус', 'тушёнка',
+    'жаркое', 'пицца', 'ризотто', 'гуляш', 'окрошка',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'летний', 'острый', 'сытный', 'постный',
+    'праздничный', 'бабушкин', 'лёгкий', 'пряный', 'воздушный', 'деревенский',
+)
+TEXT_WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'перемешать', 'варить', 'тушить',
+    'посолить', 'подавать', 'минут', 'огонь', 'сковорода', 'кастрюля',
+    'духовка', 'мелко', 'кубиками', 'соломкой', 'горячим', 'охладить',
+)
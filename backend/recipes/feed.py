@@ -0,0 +1,198 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from recipes.models import FeedEntry, Recipe
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+TRIM_FEEDS = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY user_id ORDER BY pub_date DESC, recipe_id DESC
+        ) AS position
+        FROM {table}
+        WHERE user_id IN ({placeholders})
+    ) AS ranked
+    WHERE position > %s
+)
+"""
+
+
+def is_fanned_out(author):
+    """
+    Рецепты автора раскладываются по лентам подписчиков при публикации,
+    если подписчиков не слишком много. Иначе они добавляются при чтении.
+    """
+    return author.subscribers_count <= settings.FEED_FANOUT_LIMIT
+
+
+def trim_feeds(user_ids):
+    """Оставляет в лентах пользователей FEED_LENGTH последних записей."""
+    user_ids = list(user_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                TRIM_FEEDS.format(
+                    table=FeedEntry._meta.db_table,
+                    placeholders=', '.join(['%s'] * len(batch)),
+                ),
+                batch + [settings.FEED_LENGTH],
+            )
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if not is_fanned_out(recipe.author):
+        return
+    followers = list(User.subscribe.through.objects.filter(
+        to_customuser_id=recipe.author_id
+    ).values_list('from_customuser_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=follower,
+                recipe_id=recipe.id,
+                pub_date=recipe.pub_date,
+            )
+            for follower in followers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds(followers)
+
+
+def backfill_feed(user, author):
+    """Добавляет в ленту пользователя последние рецепты нового автора."""
+    if not is_fanned_out(author):
+        return
+    recipes = author.recipes.order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user.id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_feeds([user.id])
+
+
+def rebuild_feed(user):
+    """Заполняет ленту пользователя заново по его подпискам."""
+    FeedEntry.objects.filter(user=user).delete()
+    recipes = Recipe.objects.filter(
+        author__in=user.subscribe.filter(
+            subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+        )
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user.id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def remove_from_feed(user, author):
+    """Убирает из ленты пользователя рецепты автора после отписки."""
+    FeedEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+class Feed:
+    """
+    Лента подписок пользователя для пагинаторов. Записи ленты
+    сортируются и ограничиваются по индексу (user, pub_date), рецепты
+    популярных авторов - по индексу рецептов, и только первые
+    offset + limit строк каждого источника сливаются в Python.
+    Поддерживает count() и срезы, а также order_by и filter по дате
+    публикации, которые использует курсорная пагинация.
+    """
+
+    ordered = True
+
+    def __init__(self, user, recipes, popular=None, reverse=False,
+                 filters=None):
+        self.user = user
+        self.recipes = recipes
+        if popular is None:
+            popular = list(user.subscribe.filter(
+                subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+            ).values_list('id', flat=True))
+        self.popular = popular
+        self.reverse = reverse
+        self.filters = filters or {}
+
+    def clone(self, **kwargs):
+        options = {
+            'popular': self.popular,
+            'reverse': self.reverse,
+            'filters': self.filters,
+            **kwargs,
+        }
+        return Feed(self.user, self.recipes, **options)
+
+    def order_by(self, *fields):
+        """Новые рецепты первыми или, если первое поле без '-', последними."""
+        return self.clone(reverse=not fields[0].startswith('-'))
+
+    def filter(self, **filters):
+        """Условия на дату публикации, например pub_date__lt."""
+        return self.clone(filters={**self.filters, **filters})
+
+    def get_entries(self):
+        entries = FeedEntry.objects.filter(user=self.user, **self.filters)
+        if not self.recipes.query.has_filters():
+            return entries
+        # Фильтры рецептов (теги, поиск) применяются к записям ленты.
+        return entries.filter(recipe_id__in=self.recipes.values('id'))
+
+    def get_popular_recipes(self):
+        return self.recipes.filter(author_id__in=self.popular, **self.filters)
+
+    def count(self):
+        entries = self.get_entries()
+        if not self.popular:
+            return entries.count()
+        return entries.count() + self.get_popular_recipes().exclude(
+            id__in=entries.values('recipe_id')
+        ).count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        prefix = '' if self.reverse else '-'
+        keys = list(self.get_entries().order_by(
+            f'{prefix}pub_date', f'{prefix}recipe_id'
+        ).values_list('pub_date', 'recipe_id')[:stop])
+        if self.popular:
+            keys.extend(self.get_popular_recipes().order_by(
+                f'{prefix}pub_date', f'{prefix}id'
+            ).values_list('pub_date', 'id')[:stop])
+            # Рецепт автора, ставшего популярным, может остаться в ленте.
+            keys = sorted(set(keys), reverse=not self.reverse)
+        ids = [recipe_id for _, recipe_id in keys[start:stop]]
+        recipes = self.recipes.in_bulk(ids)
+        return [
+            recipes[recipe_id] for recipe_id in ids if recipe_id in recipes
+        ]
+
+
+def get_feed(user, queryset=None):
+    """
+    Рецепты ленты подписок пользователя: записи ленты и рецепты
+    популярных авторов, которые не раскладываются по лентам.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return Feed(user, queryset)
@@ -0,0 +1,140 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from api.cache import bump_version
+from recipes.models import Recipe
+from recipes.storage import is_upload
+from recipes.thumbnails import delete_thumbnails, generate_thumbnails
+from sorl import thumbnail
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """Пул потоков, обрабатывающих загруженные картинки."""
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PROCESSING_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def enqueue_image_processing(recipe_id):
+    """
+    Ставит картинку рецепта в очередь обработки после фиксации
+    транзакции, в которой рецепт был сохранён.
+    """
+    if settings.IMAGE_PROCESSING_BACKEND == 'sync':
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(run_in_worker, recipe_id)
+    )
+
+
+def release_image(name):
+    """
+    Удаляет загруженную, ещё не обработанную картинку: у неё уникальное
+    имя, и на неё ссылается только один рецепт. Обработанные картинки
+    хранятся в общих файлах, которые могут в тот же момент понадобиться
+    новому рецепту, поэтому их удаляет только collect_image_garbage.
+    """
+    if name and is_upload(name):
+        Recipe._meta.get_field('image').storage.delete(name)
+
+
+def delete_unused_image(name):
+    """
+    Удаляет файл картинки и её миниатюры, если на файл больше не ссылается
+    ни один рецепт. Вызывается только для файлов, которые давно не
+    сохранялись (см. ContentAddressedStorage.save).
+    """
+    if Recipe.objects.filter(image=name).exists():
+        return False
+    image = Recipe(image=name).image
+    delete_thumbnails(image)
+    # Файл и миниатюры, созданные sorl.thumbnail в прежних версиях.
+    thumbnail.delete(image)
+    return True
+
+
+def release_image_on_commit(name):
+    """Освобождает картинку после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: release_image(name))
+
+
+def run_in_worker(recipe_id):
+    """Обработка картинки в фоновом потоке со своим соединением с БД."""
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки картинки рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def render_image(raw):
+    """
+    Декодирует загруженную картинку, поворачивает её согласно EXIF,
+    уменьшает до IMAGE_MAX_SIZE и сохраняет заново без метаданных.
+    Возвращает содержимое файла и его расширение.
+    """
+    Image.open(io.BytesIO(raw)).verify()
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(raw)))
+    max_size = settings.IMAGE_MAX_SIZE
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    output = io.BytesIO()
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image.convert('RGBA').save(output, 'PNG', optimize=True)
+        return output.getvalue(), 'png'
+    image.convert('RGB').save(
+        output, 'JPEG', quality=settings.IMAGE_QUALITY, optimize=True
+    )
+    return output.getvalue(), 'jpg'
+
+
+def process_recipe_image(recipe_id):
+    """
+    Обрабатывает загруженную картинку рецепта и создаёт её миниатюры.
+    Результат сохраняется, только если картинка рецепта не была
+    заменена за время обработки.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    raw_name = recipe.image.name
+    storage = recipe.image.storage
+    unchanged = Recipe.objects.filter(pk=recipe_id, image=raw_name)
+    try:
+        with storage.open(raw_name, 'rb') as raw:
+            content, extension = render_image(raw.read())
+    except Exception:
+        logger.warning(
+            'Картинка рецепта %s не обработана', recipe_id, exc_info=True
+        )
+        unchanged.update(
+            image_status=Recipe.IMAGE_FAILED, updated_at=timezone.now()
+        )
+        bump_version('recipes')
+        return
+    name = recipe.image.field.generate_filename(
+        recipe, f'image.{extension}'
+    )
+    name = storage.save(name, ContentFile(content))
+    # Миниатюры создаются до того, как картинка станет доступна в API.
+    generate_thumbnails(Recipe(image=name).image)
+    if not unchanged.update(
+        image=name,
+        image_status=Recipe.IMAGE_READY,
+        updated_at=timezone.now(),
+    ):
+        return
+    release_image(raw_name)
+    bump_version('recipes')
@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.image_processing import delete_unused_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок рецептов, на которые не ссылается '
+        'ни один рецепт, вместе с их миниатюрами. Обработанные картинки '
+        'удаляются только этой командой, её нужно запускать по расписанию'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе указанного числа секунд: '
+                 'они могут принадлежать ещё не сохранённым рецептам')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только вывести файлы, которые будут удалены')
+
+    def iter_files(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.iter_files(storage, os.path.join(directory, name))
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            self.stdout.write('Картинок рецептов нет')
+            return
+        referenced = set(Recipe.objects.values_list('image', flat=True))
+        deadline = time.time() - options['min_age']
+        checked = removed = freed = 0
+        for name in self.iter_files(storage, directory):
+            checked += 1
+            path = storage.path(name)
+            if name in referenced or os.path.getmtime(path) > deadline:
+                continue
+            size = os.path.getsize(path)
+            if options['dry_run']:
+                self.stdout.write(name)
+            elif not delete_unused_image(name):
+                continue
+            removed += 1
+            freed += size
+        self.stdout.write(
+            f'Проверено файлов: {checked}, удалено: {removed}, '
+            f'освобождено: {freed / 2 ** 20:.1f} МБ'
+        )
@@ -0,0 +1,291 @@
+import io
+import itertools
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from api.cache import bump_version
+from recipes.counters import repair_counters
+from recipes.fake_data import ADJECTIVES, DISHES, TEXT_WORDS
+from recipes.feed import rebuild_feed
+from recipes.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from recipes.scores import refresh_scores
+from recipes.search import update_search_vectors
+from recipes.shopping_list import rebuild_shopping_lists
+from recipes.thumbnails import generate_thumbnails
+
+User = get_user_model()
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса закона Ципфа для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетические данные для нагрузочного тестирования: '
+        'пользователей, подписки со степенным распределением, рецепты, '
+        'избранное и списки покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Количество пользователей')
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Количество рецептов')
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее количество подписок пользователя')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее количество избранных рецептов пользователя')
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее количество рецептов в списке покупок')
+        parser.add_argument(
+            '--min-ingredients', type=int, default=5,
+            help='Минимальное количество ингредиентов рецепта')
+        parser.add_argument(
+            '--max-ingredients', type=int, default=30,
+            help='Максимальное количество ингредиентов рецепта')
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов '
+                 'и рецептов')
+        parser.add_argument(
+            '--ingredients-file', type=str,
+            default=os.path.join(
+                settings.BASE_DIR, 'static', 'ingredients.json'
+            ),
+            help='Файл с ингредиентами, если в базе их нет')
+        parser.add_argument(
+            '--password', type=str, default='benchmark',
+            help='Пароль созданных пользователей')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество строк, добавляемых одним запросом')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел')
+
+    def stage(self, title, started):
+        self.stdout.write(f'{title}: {time.perf_counter() - started:.1f} с')
+        return time.perf_counter()
+
+    def get_ingredients(self, filename):
+        if not Ingredient.objects.exists():
+            call_command(
+                'import_ingredients', filename, keep_existing_data=True
+            )
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        if not ingredients:
+            raise CommandError('Нет ингредиентов для рецептов')
+        return ingredients
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def save_image(self):
+        """Одна картинка для всех рецептов: файлы хранятся по хэшу."""
+        output = io.BytesIO()
+        Image.new('RGB', (1200, 800), '#E26C2D').save(output, 'JPEG')
+        field = Recipe._meta.get_field('image')
+        name = field.storage.save(
+            field.generate_filename(None, 'image.jpg'),
+            ContentFile(output.getvalue()),
+        )
+        generate_thumbnails(Recipe(image=name).image)
+        return name
+
+    def create_users(self, count, password, batch_size):
+        last_id = User.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        prefix = f'bench{last_id}_'
+        password = make_password(password)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Пользователь',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            batch_size=batch_size,
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_follows(self, generator, users, options):
+        """
+        Подписки: число подписок пользователя распределено по Парето,
+        а авторы выбираются по закону Ципфа, поэтому у немногих авторов
+        много подписчиков, а у большинства - единицы.
+        """
+        authors = generator.sample(users, len(users))
+        weights = zipf_weights(len(authors), options['exponent'])
+        limit = min(len(users) - 1, options['follows'] * 10)
+        rows = []
+        for user in users:
+            count = int(generator.paretovariate(1.5) * options['follows'] / 3)
+            targets = set(generator.choices(
+                authors, cum_weights=weights, k=min(count, limit)
+            ))
+            targets.discard(user)
+            rows.extend(
+                User.subscribe.through(
+                    from_customuser_id=user, to_customuser_id=author
+                )
+                for author in targets
+            )
+        User.subscribe.through.objects.bulk_create(
+            rows, batch_size=options['batch_size']
+        )
+        return len(rows)
+
+    def create_recipes(self, generator, users, ingredients, tags, options):
+        authors = generator.sample(users, len(users))
+        weights = zipf_weights(len(authors), options['exponent'])
+        image = self.save_image()
+        text_words = list(TEXT_WORDS) + [name for _, name in ingredients]
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author,
+                    name=(
+                        f'{generator.choice(ADJECTIVES)} '
+                        f'{generator.choice(DISHES)} '
+                        f'{generator.choice(ingredients)[1]}'
+                    )[:100],
+                    text=' '.join(generator.choices(text_words, k=30)),
+                    image=image,
+                    cooking_time=generator.randint(5, 180),
+                )
+                for author in generator.choices(
+                    authors, cum_weights=weights, k=options['recipes']
+                )
+            ),
+            batch_size=options['batch_size'],
+        )
+        recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id'
+        ).values_list('id', flat=True))
+        ingredient_ids = [ingredient_id for ingredient_id, _ in ingredients]
+        IngredientsInRecipe.objects.bulk_create(
+            (
+                IngredientsInRecipe(
+                    recipe_id=recipe,
+                    ingredients_id=ingredient,
+                    amount=generator.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in generator.sample(
+                    ingredient_ids,
+                    min(len(ingredient_ids), generator.randint(
+                        options['min_ingredients'],
+                        options['max_ingredients'],
+                    )),
+                )
+            ),
+            batch_size=options['batch_size'],
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in generator.sample(
+                    tags, generator.randint(1, min(2, len(tags)))
+                )
+            ),
+            batch_size=options['batch_size'],
+        )
+        return recipes
+
+    def create_collections(self, generator, through, users, recipes, mean,
+                           options):
+        """Избранное или списки покупок с популярностью по закону Ципфа."""
+        recipes = generator.sample(recipes, len(recipes))
+        weights = zipf_weights(len(recipes), options['exponent'])
+        rows = []
+        for user in users:
+            chosen = set(generator.choices(
+                recipes, cum_weights=weights,
+                k=generator.randint(0, 2 * mean),
+            ))
+            rows.extend(
+                through(customuser_id=user, recipe_id=recipe)
+                for recipe in chosen
+            )
+        through.objects.bulk_create(rows, batch_size=options['batch_size'])
+        return len(rows)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт')
+        generator = random.Random(options['seed'])
+        started = time.perf_counter()
+        ingredients = self.get_ingredients(options['ingredients_file'])
+        tags = self.get_tags()
+        with transaction.atomic():
+            users = self.create_users(
+                options['users'], options['password'], options['batch_size']
+            )
+            started = self.stage(f'Пользователи ({len(users)})', started)
+            follows = self.create_follows(generator, users, options)
+            started = self.stage(f'Подписки ({follows})', started)
+            recipes = self.create_recipes(
+                generator, users, ingredients, tags, options
+            )
+            started = self.stage(f'Рецепты ({len(recipes)})', started)
+            for title, through, mean in (
+                ('Избранное', Recipe.favorite.through, options['favorites']),
+                ('Списки покупок', Recipe.cart.through, options['carts']),
+            ):
+                count = self.create_collections(
+                    generator, through, users, recipes, mean, options
+                )
+                started = self.stage(f'{title} ({count})', started)
+            repair_counters()
+            refresh_scores()
+            started = self.stage('Счётчики и рейтинги', started)
+            for user in User.objects.filter(id__in=users).iterator():
+                rebuild_feed(user)
+            started = self.stage('Ленты подписок', started)
+            rebuild_shopping_lists(users)
+            started = self.stage('Списки покупок пользователей', started)
+            update_search_vectors(recipes)
+            self.stage('Поисковые векторы', started)
+        for namespace in ('recipes', 'recipe-index', 'users', 'tags',
+                          'ingredients'):
+            bump_version(namespace)
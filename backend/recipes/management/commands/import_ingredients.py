@@ -2,11 +2,47 @@ import csv
 import json
 import mimetypes
 import os
+import time
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.cache import bump_version_on_commit
 from recipes.models import Ingredient
 
 
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """
+    Последовательно разбирает элементы JSON-массива,
+    читая файл блоками и не загружая его целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается массив JSON')
+    position = 1
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            complete = end < len(buffer) or eof
+        except ValueError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
 class Command(BaseCommand):
     help = 'Импортирует ингридиенты'
     filename: str
@@ -17,26 +53,51 @@ class Command(BaseCommand):
             'filename', type=str, help='Путь к файлу .json/.csv с данными')
         parser.add_argument(
             '--keep-existing-data', action='store_true',
-            help='Предварительная очистка данных модели Ingredients')
+            help='Не очищать данные модели Ingredients: добавить только '
+                 'отсутствующие ингредиенты, сохранив id существующих')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество ингредиентов, добавляемых одним запросом')
 
     def __load_data_from_file(self, filename, mimetype):
         with open(filename, newline='') as fp:
+            if mimetype == 'text/csv':
+                data = csv.DictReader(
+                    fp, fieldnames=('name', 'measurement_unit'))
+            else:
+                data = iter_json_array(fp)
             try:
-                if mimetype == 'text/csv':
-                    data = csv.DictReader(
-                        fp, fieldnames=('name', 'measurement_unit'))
-                else:
-                    data = json.load(fp)
-            except (json.decoder.JSONDecodeError, TypeError):
+                for item in data:
+                    yield item
+            except (ValueError, TypeError):
                 self.stderr.write(f'Файл {filename} содержит ошибки')
                 raise SystemExit
 
-            for item in data:
-                yield item
+    def __insert_batches(self, items, existing, batch_size):
+        """Добавляет отсутствующие ингредиенты пакетами."""
+        read = inserted = 0
+        batch = []
+        for item in items:
+            read += 1
+            key = (item['name'], item['measurement_unit'])
+            if key in existing:
+                continue
+            existing.add(key)
+            batch.append(Ingredient(
+                name=item['name'], measurement_unit=item['measurement_unit']
+            ))
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            Ingredient.objects.bulk_create(batch)
+            inserted += len(batch)
+        return read, inserted
 
     def handle(self, *args, **options):
         filename = options.get('filename')
-        wipe_data = not options.get('keep-exisiting-data')
+        wipe_data = not options.get('keep_existing_data')
 
         if not os.path.isfile(filename):
             self.stderr.write(f'Файл {filename} не найден')
@@ -48,9 +109,25 @@ class Command(BaseCommand):
             self.stderr.write(f'Файл {filename} имеет запрещенный формат')
             raise SystemExit
 
-        if wipe_data:
-            Ingredient.objects.all().delete()
+        started = time.perf_counter()
+        with transaction.atomic():
+            if wipe_data:
+                Ingredient.objects.all().delete()
+                existing = set()
+            else:
+                existing = set(Ingredient.objects.values_list(
+                    'name', 'measurement_unit'
+                ))
+            read, inserted = self.__insert_batches(
+                self.__load_data_from_file(filename, mimetype),
+                existing,
+                options['batch_size'],
+            )
+            bump_version_on_commit('ingredients')
 
-        for item in self.__load_data_from_file(filename, mimetype):
-            obj = Ingredient(**item)
-            obj.save()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Прочитано: {read}, добавлено: {inserted}, '
+            f'пропущено: {read - inserted}, время: {elapsed:.2f} с, '
+            f'скорость: {read / elapsed if elapsed else read:.0f} строк/с'
+        )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from recipes.image_processing import process_recipe_image
+from recipes.models import Recipe
+from recipes.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает картинки рецептов, оставшиеся в очереди, '
+        'например после перезапуска сервера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--failed', action='store_true',
+            help='Повторить обработку картинок, завершившуюся ошибкой')
+        parser.add_argument(
+            '--thumbnails', action='store_true',
+            help='Создать недостающие миниатюры обработанных картинок, '
+                 'например после обновления')
+
+    def generate_thumbnails(self):
+        images = Recipe.objects.filter(
+            image_status=Recipe.IMAGE_READY
+        ).values_list('image', flat=True).distinct()
+        for name in images.iterator():
+            generate_thumbnails(Recipe(image=name).image)
+        self.stdout.write(f'Проверено картинок: {images.count()}')
+
+    def handle(self, *args, **options):
+        if options['thumbnails']:
+            self.generate_thumbnails()
+        statuses = [Recipe.IMAGE_PROCESSING]
+        if options['failed']:
+            statuses.append(Recipe.IMAGE_FAILED)
+        recipe_ids = Recipe.objects.filter(
+            image_status__in=statuses
+        ).values_list('id', flat=True)
+        for recipe_id in recipe_ids:
+            process_recipe_image(recipe_id)
+        ready = Recipe.objects.filter(
+            id__in=list(recipe_ids), image_status=Recipe.IMAGE_READY
+        ).count()
+        self.stdout.write(
+            f'Обработано картинок: {len(recipe_ids)}, успешно: {ready}'
+        )
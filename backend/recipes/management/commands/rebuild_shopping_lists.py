@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Заполняет списки покупок заново по корзинам пользователей'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_shopping_lists()
+        self.stdout.write(
+            f'Строк в списках покупок: {ShoppingListItem.objects.count()}'
+        )
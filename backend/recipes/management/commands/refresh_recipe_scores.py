@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.scores import refresh_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие рейтинги рецептов, пересчитывает популярность '
+        'и тренд'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = refresh_scores()
+        self.stdout.write(f'Создано рейтингов: {created}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного, списков покупок, '
+        'рецептов и подписчиков'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            repaired = repair_counters()
+        for counter, count in repaired.items():
+            self.stdout.write(f'{counter}: исправлено записей - {count}')
@@ -0,0 +1,19 @@
+from django.db import models
+from django.db.models import OuterRef, Subquery
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор рецептов с дополнительными выборками."""
+
+    def latest_by_author(self, limit=None):
+        """
+        Последние рецепты каждого автора, не более limit штук на автора.
+        Ограничение выполняется коррелированным подзапросом, поэтому рецепты
+        всех авторов загружаются одним запросом.
+        """
+        if limit is None:
+            return self
+        latest = self.model.objects.filter(
+            author_id=OuterRef('author_id')
+        ).order_by('-pub_date', '-id').values('pk')[:limit]
+        return self.filter(pk__in=Subquery(latest))
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:56
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Recipe.objects.update(
+        favorites_count=count_related(
+            Recipe.favorite.through.objects.all(), 'recipe'),
+        carts_count=count_related(
+            Recipe.cart.through.objects.all(), 'recipe'),
+    )
+    CustomUser.objects.update(
+        recipes_count=count_related(Recipe.objects.all(), 'author'),
+        subscribers_count=count_related(
+            CustomUser.subscribe.through.objects.all(), 'to_customuser'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_auto_20221022_2033'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
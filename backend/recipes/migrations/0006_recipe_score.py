@@ -0,0 +1,52 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:57
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+EPOCH = datetime(2022, 1, 1)
+
+
+def fill_scores(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    scores = []
+    for recipe in Recipe.objects.only(
+            'id', 'pub_date', 'favorites_count', 'carts_count').iterator():
+        popularity = recipe.favorites_count + recipe.carts_count
+        hours = (recipe.pub_date - EPOCH).total_seconds() / 3600
+        scores.append(RecipeScore(
+            recipe_id=recipe.id,
+            popularity=popularity,
+            trending=(
+                math.log2(1 + popularity)
+                + hours / settings.TRENDING_HALF_LIFE
+            ),
+        ))
+    RecipeScore.objects.bulk_create(scores, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('popularity', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(db_index=True, default=0, verbose_name='Тренд')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='ready', max_length=10, verbose_name='Состояние обработки изображения'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:06
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+FILL_SEARCH_VECTORS = """
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector(%(config)s, recipe.name), 'A')
+    || setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_ingredientsinrecipe AS amount
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = amount.ingredients_id
+        WHERE amount.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s, recipe.text), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        FILL_SEARCH_VECTORS, {'config': settings.SEARCH_CONFIG}
+    )
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_idx '
+        'ON recipes_recipe USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
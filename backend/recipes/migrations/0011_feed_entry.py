@@ -0,0 +1,61 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    User = apps.get_model('users', 'CustomUser')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    followers = User.objects.filter(subscribe__isnull=False).distinct()
+    for user in followers.iterator():
+        recipes = Recipe.objects.filter(
+            author__in=user.subscribe.filter(
+                subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+            )
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date'
+        )[:settings.FEED_LENGTH]
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user=user, recipe_id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_counters'),
+        ('recipes', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Записи ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
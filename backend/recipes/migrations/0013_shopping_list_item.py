@@ -0,0 +1,57 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = Recipe.cart.through.objects.order_by().values(
+        'customuser_id', 'recipe__ingredientsinrecipe__ingredients_id'
+    ).annotate(
+        total=models.Sum('recipe__ingredientsinrecipe__amount')
+    ).filter(total__gt=0)
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=row['customuser_id'],
+                ingredient_id=row[
+                    'recipe__ingredientsinrecipe__ingredients_id'
+                ],
+                amount=row['total'],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0012_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Строка списка покупок',
+                'verbose_name_plural': 'Строки списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
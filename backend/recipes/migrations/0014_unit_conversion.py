@@ -0,0 +1,46 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:34
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+UNIT_CONVERSIONS = (
+    ('кг', 'г', 1000),
+    ('мг', 'г', Decimal('0.001')),
+    ('л', 'мл', 1000),
+)
+
+
+def add_unit_conversions(apps, schema_editor):
+    UnitConversion = apps.get_model('recipes', 'UnitConversion')
+    UnitConversion.objects.bulk_create(
+        UnitConversion(unit=unit, canonical_unit=canonical_unit, factor=factor)
+        for unit, canonical_unit, factor in UNIT_CONVERSIONS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(max_length=10, unique=True, verbose_name='Единица измерения')),
+                ('canonical_unit', models.CharField(max_length=10, verbose_name='Каноническая единица измерения')),
+                ('factor', models.DecimalField(decimal_places=6, max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.000001'))], verbose_name='Множитель')),
+            ],
+            options={
+                'verbose_name': 'Перевод единицы измерения',
+                'verbose_name_plural': 'Переводы единиц измерения',
+                'ordering': ['unit'],
+            },
+        ),
+        migrations.RunPython(
+            add_unit_conversions, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.19 on 2026-10-18 20:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_score_events(apps, schema_editor):
+    """Время существующих добавлений неизвестно: берётся дата публикации."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ScoreEvent = apps.get_model('recipes', 'ScoreEvent')
+    for kind, through in (
+        ('favorite', Recipe.favorite.through),
+        ('cart', Recipe.cart.through),
+    ):
+        rows = through.objects.values_list(
+            'recipe_id', 'customuser_id', 'recipe__pub_date'
+        )
+        ScoreEvent.objects.bulk_create(
+            (
+                ScoreEvent(
+                    recipe_id=recipe_id,
+                    user_id=user_id,
+                    kind=kind,
+                    added_at=pub_date,
+                )
+                for recipe_id, user_id, pub_date in rows.iterator()
+            ),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0015_recipe_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('favorite', 'Избранное'), ('cart', 'Список покупок')], max_length=10, verbose_name='Тип')),
+                ('added_at', models.DateTimeField(verbose_name='Дата добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_events', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_events', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Добавление рецепта',
+                'verbose_name_plural': 'Добавления рецептов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scoreevent',
+            constraint=models.UniqueConstraint(fields=('recipe', 'user', 'kind'), name='unique_score_event'),
+        ),
+        migrations.RunPython(fill_score_events, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+from decimal import Decimal
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from recipes.managers import RecipeQuerySet
+from recipes.storage import ContentAddressedStorage
 from recipes.validators import validate_min_amount
 
 User = settings.AUTH_USER_MODEL
@@ -64,9 +69,54 @@ class Ingredient(models.Model):
         return self.name
 
 
+class UnitConversion(models.Model):
+    """
+    Перевод единицы измерения в каноническую: количество в единице unit,
+    умноженное на factor, равно количеству в единице canonical_unit.
+    Единицы без перевода в списке покупок не меняются.
+    """
+
+    unit = models.CharField(
+        verbose_name='Единица измерения',
+        max_length=10,
+        unique=True,
+    )
+
+    canonical_unit = models.CharField(
+        verbose_name='Каноническая единица измерения',
+        max_length=10,
+    )
+
+    factor = models.DecimalField(
+        verbose_name='Множитель',
+        max_digits=12,
+        decimal_places=6,
+        validators=(
+            MinValueValidator(Decimal('0.000001')),
+        ),
+    )
+
+    class Meta:
+        ordering = ['unit', ]
+        verbose_name_plural = 'Переводы единиц измерения'
+        verbose_name = 'Перевод единицы измерения'
+
+    def __str__(self):
+        return f'1 {self.unit} = {self.factor:g} {self.canonical_unit}'
+
+
 class Recipe(models.Model):
     """Рецепты."""
 
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PROCESSING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -82,9 +132,17 @@ class Recipe(models.Model):
 
     image = models.ImageField(
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
         verbose_name='Изображение'
     )
 
+    image_status = models.CharField(
+        verbose_name='Состояние обработки изображения',
+        max_length=10,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_READY,
+    )
+
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -111,6 +169,11 @@ class Recipe(models.Model):
         auto_now_add=True,
     )
 
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+
     favorite = models.ManyToManyField(
         User,
         blank=True,
@@ -125,10 +188,39 @@ class Recipe(models.Model):
         verbose_name='Список покупок',
     )
 
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        db_index=True,
+    )
+
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в список покупок',
+        default=0,
+    )
+
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ['-pub_date', ]
         verbose_name_plural = 'Рецепты'
         verbose_name = 'Рецепт'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['updated_at'],
+                name='recipe_updated_at_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -168,3 +260,171 @@ class IngredientsInRecipe(models.Model):
                 name='unique_ingredient_in_recipes'
             )
         ]
+
+
+class RecipeScore(models.Model):
+    """Рейтинг рецепта для сортировки по популярности и трендам."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+
+    popularity = models.PositiveIntegerField(
+        verbose_name='Популярность',
+        default=0,
+        db_index=True,
+    )
+
+    trending = models.FloatField(
+        verbose_name='Тренд',
+        default=0,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return str(self.recipe)
+
+
+class ScoreEvent(models.Model):
+    """
+    Добавление рецепта пользователем в избранное или список покупок.
+    Время добавления нужно, чтобы при удалении вычесть из тренда
+    ровно тот вклад, который внесло добавление.
+    """
+
+    FAVORITE = 'favorite'
+    CART = 'cart'
+    KINDS = (
+        (FAVORITE, 'Избранное'),
+        (CART, 'Список покупок'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='score_events',
+        verbose_name='Рецепт',
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='score_events',
+        verbose_name='Пользователь',
+    )
+
+    kind = models.CharField(
+        max_length=10,
+        choices=KINDS,
+        verbose_name='Тип',
+    )
+
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+    )
+
+    class Meta:
+        verbose_name = 'Добавление рецепта'
+        verbose_name_plural = 'Добавления рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'user', 'kind'],
+                name='unique_score_event',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe} ({self.kind})'
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Лента ограничена FEED_LENGTH последними рецептами.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Строка списка покупок пользователя: суммарное количество ингредиента
+    во всех рецептах его корзины. Изменяется при добавлении и удалении
+    рецептов корзины и при изменении их ингредиентов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}'
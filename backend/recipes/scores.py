@@ -0,0 +1,174 @@
+import math
+from datetime import datetime as dt
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from recipes.models import Recipe, RecipeScore, ScoreEvent
+
+EPOCH = dt(2022, 1, 1)
+BATCH_SIZE = 500
+
+
+def decayed(weight, moment=None):
+    """
+    Вклад события с весом weight в тренд, в логарифмической шкале.
+    Вес событий удваивается каждые TRENDING_HALF_LIFE часов, поэтому
+    старые события со временем уступают новым, а логарифм не даёт
+    значению переполниться.
+    """
+    hours = ((moment or dt.now()) - EPOCH).total_seconds() / 3600
+    return math.log2(weight) + hours / settings.TRENDING_HALF_LIFE
+
+
+def log2_sum(first, second):
+    """log2(2 ** first + 2 ** second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def initial_score(recipe, popularity=0):
+    """
+    Рейтинг рецепта без истории событий: публикация и все добавления
+    считаются произошедшими в момент публикации.
+    """
+    return RecipeScore(
+        recipe=recipe,
+        popularity=popularity,
+        trending=decayed(1 + popularity, recipe.pub_date),
+    )
+
+
+def log2_difference(first, second):
+    """
+    log2(2 ** first - 2 ** second) для second < first.
+    Разность не опускается ниже вклада, сравнимого с ошибкой округления.
+    """
+    return first + math.log2(max(1 - 2 ** (second - first), 2 ** -40))
+
+
+def score_added(recipe_id, user_id, kind):
+    """
+    Учитывает добавление рецепта в избранное (kind='favorite')
+    или список покупок (kind='cart') и запоминает его время.
+    """
+    with transaction.atomic():
+        score = RecipeScore.objects.select_for_update().filter(
+            recipe_id=recipe_id
+        ).first()
+        if score is None:
+            score = initial_score(Recipe.objects.get(id=recipe_id))
+        added_at = dt.now()
+        ScoreEvent.objects.create(
+            recipe_id=recipe_id, user_id=user_id, kind=kind,
+            added_at=added_at,
+        )
+        score.popularity += 1
+        score.trending = log2_sum(score.trending, decayed(1, added_at))
+        score.save()
+
+
+def score_removed(recipe_id, user_id, kind):
+    """
+    Учитывает удаление рецепта из избранного или списка покупок:
+    из тренда вычитается вклад, который внесло добавление, поэтому
+    повторные добавления и удаления не поднимают рецепт.
+    """
+    with transaction.atomic():
+        score = RecipeScore.objects.select_for_update().filter(
+            recipe_id=recipe_id
+        ).first()
+        event = ScoreEvent.objects.filter(
+            recipe_id=recipe_id, user_id=user_id, kind=kind
+        ).first()
+        if event is not None:
+            event.delete()
+        if score is None:
+            return
+        score.popularity = max(score.popularity - 1, 0)
+        if event is not None:
+            score.trending = log2_difference(
+                score.trending, decayed(1, event.added_at)
+            )
+        score.save()
+
+
+def sync_score_events():
+    """
+    Создаёт события для добавлений без событий (например, созданных
+    generate_data) с датой публикации рецепта и удаляет события
+    без добавлений.
+    """
+    for kind, through in (
+        (ScoreEvent.FAVORITE, Recipe.favorite.through),
+        (ScoreEvent.CART, Recipe.cart.through),
+    ):
+        events = ScoreEvent.objects.filter(
+            kind=kind,
+            recipe_id=OuterRef('recipe_id'),
+            user_id=OuterRef('customuser_id'),
+        )
+        rows = through.objects.annotate(
+            has_event=Exists(events)
+        ).filter(has_event=False).values_list(
+            'recipe_id', 'customuser_id', 'recipe__pub_date'
+        )
+        ScoreEvent.objects.bulk_create(
+            (
+                ScoreEvent(
+                    recipe_id=recipe_id,
+                    user_id=user_id,
+                    kind=kind,
+                    added_at=pub_date,
+                )
+                for recipe_id, user_id, pub_date in rows.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        ScoreEvent.objects.filter(kind=kind).annotate(
+            has_row=Exists(through.objects.filter(
+                recipe_id=OuterRef('recipe_id'),
+                customuser_id=OuterRef('user_id'),
+            ))
+        ).filter(has_row=False).delete()
+
+
+def refresh_scores():
+    """
+    Создаёт недостающие рейтинги, пересчитывает популярность
+    по счётчикам рецептов и тренд по событиям добавления.
+    Возвращает количество созданных рейтингов.
+    """
+    missing = Recipe.objects.filter(score__isnull=True).annotate(
+        popularity=F('favorites_count') + F('carts_count')
+    ).only('id', 'pub_date')
+    created = RecipeScore.objects.bulk_create(
+        [initial_score(recipe, recipe.popularity) for recipe in missing],
+        batch_size=BATCH_SIZE,
+    )
+    RecipeScore.objects.update(popularity=Subquery(
+        Recipe.objects.filter(pk=OuterRef('recipe_id')).values(
+            total=F('favorites_count') + F('carts_count')
+        )[:1]
+    ))
+    sync_score_events()
+    trending = {
+        recipe_id: decayed(1, pub_date)
+        for recipe_id, pub_date in Recipe.objects.values_list(
+            'id', 'pub_date'
+        ).iterator()
+    }
+    events = ScoreEvent.objects.values_list('recipe_id', 'added_at')
+    for recipe_id, added_at in events.iterator():
+        trending[recipe_id] = log2_sum(
+            trending[recipe_id], decayed(1, added_at)
+        )
+    RecipeScore.objects.bulk_update(
+        (
+            RecipeScore(recipe_id=recipe_id, trending=value)
+            for recipe_id, value in trending.items()
+        ),
+        ['trending'],
+        batch_size=BATCH_SIZE,
+    )
+    return len(created)
@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F
+from recipes.models import IngredientsInRecipe, Recipe
+
+# Тот же вектор, что и в миграции 0010: название важнее ингредиентов,
+# ингредиенты важнее описания.
+UPDATE_SEARCH_VECTORS = """
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector(%(config)s, recipe.name), 'A')
+    || setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_ingredientsinrecipe AS amount
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = amount.ingredients_id
+        WHERE amount.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s, recipe.text), 'C')
+WHERE recipe.id = ANY(%(ids)s)
+"""
+
+
+def full_text_search_available():
+    """Полнотекстовый поиск средствами БД доступен только в PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def get_ingredient_names(recipe_ids):
+    """Названия ингредиентов рецептов одной строкой для каждого рецепта."""
+    names = {}
+    rows = IngredientsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredients__name')
+    for recipe_id, name in rows:
+        names.setdefault(recipe_id, []).append(name)
+    return {
+        recipe_id: ' '.join(recipe_names)
+        for recipe_id, recipe_names in names.items()
+    }
+
+
+def iter_recipe_documents(recipe_ids=None):
+    """
+    Тексты рецептов для поискового индекса в памяти процесса:
+    id, название, названия ингредиентов и описание.
+    Все рецепты, если recipe_ids не передан.
+    """
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    names = get_ingredient_names(recipes.values('id'))
+    rows = recipes.values_list('id', 'name', 'text').order_by()
+    for recipe_id, name, text in rows.iterator():
+        yield recipe_id, name, names.get(recipe_id, ''), text
+
+
+def update_search_vectors(recipe_ids):
+    """
+    Пересчитывает поисковые векторы рецептов с переданными id
+    одним запросом.
+    """
+    if not full_text_search_available():
+        return
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPDATE_SEARCH_VECTORS,
+            {'config': settings.SEARCH_CONFIG, 'ids': recipe_ids},
+        )
+
+
+def update_search_vectors_on_commit(recipe_ids):
+    """
+    Пересчитывает поисковые векторы после фиксации текущей транзакции.
+    Рецепты, изменённые в одной транзакции, обновляются одним запросом.
+    """
+    if not full_text_search_available():
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        update_search_vectors(recipe_ids)
+        return
+    for _, callback in connection.run_on_commit:
+        pending = getattr(callback, 'search_vector_ids', None)
+        if pending is not None:
+            pending.update(recipe_ids)
+            return
+
+    def update():
+        update_search_vectors(update.search_vector_ids)
+
+    update.search_vector_ids = set(recipe_ids)
+    transaction.on_commit(update)
+
+
+def search_recipes(queryset, value):
+    """
+    Рецепты, подходящие под поисковый запрос, отсортированные
+    по релевантности.
+    """
+    query = SearchQuery(value, config=settings.SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-pub_date')
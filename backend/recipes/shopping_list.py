@@ -0,0 +1,164 @@
+from django.db import connection
+from django.db.models import (DecimalField, ExpressionWrapper, F, OuterRef,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Cast, Coalesce
+from recipes.models import (Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingListItem, UnitConversion)
+
+BATCH_SIZE = 500
+
+# Количество ингредиентов рецепта, умноженное на sign, прибавляется
+# к спискам покупок пользователей, у которых рецепт в корзине.
+APPLY_RECIPE = """
+INSERT INTO {items} (user_id, ingredient_id, amount)
+SELECT cart.customuser_id, recipe.ingredients_id, recipe.amount * %s
+FROM {cart} AS cart
+JOIN {amounts} AS recipe ON recipe.recipe_id = cart.recipe_id
+WHERE cart.recipe_id = %s{condition}
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET amount = {items}.amount + excluded.amount
+"""
+
+# Изменение количества одного ингредиента рецепта прибавляется
+# к спискам покупок пользователей, у которых рецепт в корзине.
+APPLY_INGREDIENT = """
+INSERT INTO {items} (user_id, ingredient_id, amount)
+SELECT cart.customuser_id, %s, %s
+FROM {cart} AS cart
+WHERE cart.recipe_id = %s
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET amount = {items}.amount + excluded.amount
+"""
+
+
+def get_tables():
+    """Таблицы, которые используются в запросах."""
+    return {
+        'items': ShoppingListItem._meta.db_table,
+        'cart': Recipe.cart.through._meta.db_table,
+        'amounts': IngredientsInRecipe._meta.db_table,
+    }
+
+
+def apply_recipe(recipe_id, sign, user_id=None):
+    """
+    Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта
+    в списке покупок пользователя или, если он не передан, всех
+    пользователей с рецептом в корзине. Рецепт должен быть в корзине.
+    """
+    params = [sign, recipe_id]
+    condition = ''
+    if user_id is not None:
+        condition = ' AND cart.customuser_id = %s'
+        params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            APPLY_RECIPE.format(condition=condition, **get_tables()), params
+        )
+    if sign < 0:
+        delete_empty_items(recipe_id, user_id)
+
+
+def delete_empty_items(recipe_id, user_id=None):
+    """Удаляет строки, количество в которых стало нулевым."""
+    items = ShoppingListItem.objects.filter(amount__lte=0)
+    if user_id is not None:
+        items = items.filter(user_id=user_id)
+    else:
+        items = items.filter(user__carts=recipe_id)
+    items.delete()
+
+
+def add_to_shopping_list(user_id, recipe_id):
+    """Вызывается после добавления рецепта в корзину."""
+    apply_recipe(recipe_id, 1, user_id)
+
+
+def remove_from_shopping_list(user_id, recipe_id):
+    """Вызывается до удаления рецепта из корзины."""
+    apply_recipe(recipe_id, -1, user_id)
+
+
+def change_shopping_lists(recipe_id, deltas):
+    """
+    Прибавляет изменения количества ингредиентов рецепта
+    ({id ингредиента: разница}) к спискам покупок.
+    """
+    deltas = {
+        ingredient: delta for ingredient, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            APPLY_INGREDIENT.format(**get_tables()),
+            [
+                (ingredient, delta, recipe_id)
+                for ingredient, delta in deltas.items()
+            ],
+        )
+    if any(delta < 0 for delta in deltas.values()):
+        delete_empty_items(recipe_id)
+
+
+def rebuild_shopping_lists(user_ids=None):
+    """
+    Заполняет списки покупок заново по корзинам пользователей
+    (всех, если user_ids не передан).
+    """
+    items = ShoppingListItem.objects.all()
+    carts = Recipe.cart.through.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        items = items.filter(user_id__in=user_ids)
+        carts = carts.filter(customuser_id__in=user_ids)
+    items.delete()
+    rows = carts.order_by().values(
+        'customuser_id', 'recipe__ingredientsinrecipe__ingredients_id'
+    ).annotate(
+        total=Sum('recipe__ingredientsinrecipe__amount')
+    ).filter(total__gt=0)
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['customuser_id'],
+                ingredient_id=row[
+                    'recipe__ingredientsinrecipe__ingredients_id'
+                ],
+                amount=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def get_shopping_list(user):
+    """
+    Список покупок пользователя для выгрузки: количество каждого продукта
+    в канонической единице измерения (см. UnitConversion), например
+    граммы и килограммы одного продукта складываются в граммах.
+    """
+    conversion = UnitConversion.objects.filter(
+        unit=OuterRef('measurement_unit')
+    ).order_by()
+    return Ingredient.objects.filter(
+        shopping_list_items__user=user
+    ).values(
+        ingredient=F('name'),
+        measure=Coalesce(
+            Subquery(conversion.values('canonical_unit')),
+            F('measurement_unit'),
+        ),
+    ).annotate(
+        amount=Cast(
+            Sum(ExpressionWrapper(
+                F('shopping_list_items__amount') * Coalesce(
+                    Subquery(conversion.values('factor')),
+                    Value(1),
+                ),
+                output_field=DecimalField(),
+            )),
+            DecimalField(max_digits=18, decimal_places=2),
+        )
+    ).order_by('ingredient', 'measure')
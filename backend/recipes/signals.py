@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from api.cache import append_to_log_on_commit, bump_version_on_commit
+from recipes.counters import change_counter
+from recipes.feed import fan_out_recipe
+from recipes.image_processing import release_image_on_commit
+from recipes.models import IngredientsInRecipe, Recipe
+from recipes.scores import initial_score
+from recipes.search import update_search_vectors_on_commit
+from recipes.shopping_list import apply_recipe
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    """
+    Увеличивает счётчик рецептов автора, создаёт рейтинг рецепта
+    и добавляет рецепт в ленты подписчиков автора.
+    После любого изменения рецепта обновляет его поисковый вектор
+    и меняет версии пространств 'recipes' и 'recipe-index'.
+    """
+
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        initial_score(instance).save()
+        transaction.on_commit(lambda: fan_out_recipe(instance))
+    update_search_vectors_on_commit([instance.id])
+    bump_version_on_commit('recipes')
+    bump_version_on_commit('recipe-index')
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """
+    Обновляет поисковый вектор рецепта при правке его ингредиентов.
+    На удаление не подписываемся, чтобы не терять быстрое каскадное
+    удаление: админка и API при этом всё равно сохраняют сам рецепт.
+    """
+
+    update_search_vectors_on_commit([instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты рецепта из списков покупок, пока рецепт
+    ещё в корзинах пользователей.
+    """
+
+    apply_recipe(instance.id, -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """
+    Уменьшает счётчик рецептов автора, удаляет картинку рецепта,
+    если она не используется в других рецептах, и записывает id рецепта
+    в журнал 'recipe-index' для индексов в памяти процессов.
+    """
+
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    release_image_on_commit(instance.image.name)
+    bump_version_on_commit('recipes')
+    append_to_log_on_commit('recipe-index', instance.id)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Каталог загруженных, ещё не обработанных картинок.
+UPLOADS_DIRECTORY = 'uploads'
+# Каталог миниатюр: их имена производные от имён картинок.
+THUMBNAILS_DIRECTORY = 'thumbnails'
+
+
+def is_upload(name):
+    """Загруженная картинка с уникальным именем, а не общий файл."""
+    return UPLOADS_DIRECTORY in name.split('/')
+
+
+def is_thumbnail(name):
+    """Миниатюра картинки, имя которой задаёт recipes.thumbnails."""
+    return name.split('/')[0] == THUMBNAILS_DIRECTORY
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище картинок рецептов, в котором имя файла - хэш его содержимого.
+    Одинаковые картинки хранятся в одном файле, а файл с заданным именем
+    никогда не меняется, поэтому его можно кэшировать бессрочно.
+    Загруженные картинки временные и хранятся под уникальными именами:
+    общий файл загрузки мог быть удалён после обработки одного рецепта
+    до фиксации транзакции, сохраняющей другой рецепт. Миниатюры
+    сохраняются под именами, производными от имени картинки.
+    Повторное сохранение существующего файла обновляет время его
+    изменения, чтобы collect_image_garbage не удалил файл, который
+    вот-вот станет картинкой нового рецепта.
+    """
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        checksum = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), checksum[:2], checksum + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if is_upload(name) or is_thumbnail(name):
+            return super().save(name, content, max_length)
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def _save(self, name, content):
+        """
+        Файл записывается под временным именем и атомарно переименовывается,
+        поэтому недописанный файл никогда не виден под итоговым именем.
+        """
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
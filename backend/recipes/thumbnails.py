@@ -0,0 +1,75 @@
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+from recipes.storage import THUMBNAILS_DIRECTORY
+
+THUMBNAIL_FORMATS = ('JPEG', 'WEBP') if features.check('webp') else ('JPEG',)
+THUMBNAIL_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def get_thumbnail_name(name, size, thumbnail_format='JPEG'):
+    """
+    Имя файла миниатюры. Оно определяется именем картинки (хэшем её
+    содержимого), размером и форматом, поэтому адрес миниатюры
+    вычисляется без обращения к БД и файловой системе.
+    """
+    return posixpath.join(
+        THUMBNAILS_DIRECTORY,
+        size,
+        posixpath.splitext(name)[0]
+        + '.' + THUMBNAIL_EXTENSIONS[thumbnail_format],
+    )
+
+
+def get_thumbnail_url(image, size, thumbnail_format='JPEG'):
+    """Адрес миниатюры обработанной картинки рецепта."""
+    if not image or thumbnail_format not in THUMBNAIL_FORMATS:
+        return None
+    return image.storage.url(
+        get_thumbnail_name(image.name, size, thumbnail_format)
+    )
+
+
+def render_thumbnail(source, size, thumbnail_format):
+    """Миниатюра заданного размера с обрезкой по центру."""
+    width, height = map(int, settings.RECIPE_THUMBNAILS[size].split('x'))
+    thumbnail = ImageOps.fit(source, (width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.convert('RGB').save(
+        output, thumbnail_format, quality=settings.THUMBNAIL_QUALITY
+    )
+    return output.getvalue()
+
+
+def generate_thumbnails(image):
+    """
+    Создаёт миниатюры картинки всех размеров и форматов. Миниатюры
+    одинаковых картинок общие, поэтому существующие не создаются заново.
+    """
+    storage = image.storage
+    source = None
+    for size in settings.RECIPE_THUMBNAILS:
+        for thumbnail_format in THUMBNAIL_FORMATS:
+            name = get_thumbnail_name(image.name, size, thumbnail_format)
+            if storage.exists(name):
+                continue
+            if source is None:
+                with storage.open(image.name, 'rb') as file:
+                    source = Image.open(io.BytesIO(file.read()))
+                    source.load()
+            storage.save(
+                name,
+                ContentFile(render_thumbnail(source, size, thumbnail_format)),
+            )
+
+
+def delete_thumbnails(image):
+    """Удаляет миниатюры картинки всех размеров и форматов."""
+    for size in settings.RECIPE_THUMBNAILS:
+        for thumbnail_format in THUMBNAIL_EXTENSIONS:
+            image.storage.delete(
+                get_thumbnail_name(image.name, size, thumbnail_format)
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество рецептов'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество подписчиков'),
+        ),
+    ]
@@ -14,6 +14,15 @@ class CustomUser(AbstractUser):
         related_name='subscribers',
         symmetrical=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        db_index=True,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api.cache import bump_version_on_commit
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    """
+    Меняет версию пространства имён 'users' при изменении данных
+    пользователя, которые попадают в ответы API. Вход в систему
+    обновляет только last_login и версию не меняет.
+    """
+
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_version_on_commit('users')